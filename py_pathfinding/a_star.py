@@ -1,7 +1,7 @@
+import heapq
+import math
+import time
 import numpy as np
-from datetime import datetime
-import pickle
-from pathlib import Path
 
 
 
@@ -10,89 +10,286 @@ import logging
 _logger = logging.getLogger('pathfinding_logger')
 
 # from geometry import GridCell, GridMaze
-from nicpy import nic_misc
+from history import HistoryRecorder, new_history_directory
+from search_result import SearchResult, ObserverGroup, timed_call, FOUND, UNREACHABLE, MAX_ITERATIONS, TIME_LIMIT
 
 
 
-def reconstruct_path(current_node):
+def reconstruct_path(current_node, closed_list, graph):
 
-    path, current = [], current_node
-    while current is not None:
+    # Search nodes only hold their parent's index; every parent has been expanded, so it is in the closed set
+    path, current = [current_node.label], current_node
+    while current.parent_index != -1:
+        current = closed_list[graph.index_to_label(current.parent_index)]
         path.append(current.label)
-        current = current.parent
     return path[::-1]
 
 
-def run_a_star(graph, heuristic_type, save_history = False):
+class IndexedPriorityQueue:
 
-    # If saving of algo history requested, create a timestamped directory
-    if save_history:
-        save_directory = Path.cwd()/'saved_histories'/datetime.now().strftime('%Y-%m-%d_%H_%M_%S')
-        nic_misc.mkdir_if_DNE(save_directory)
-        _logger.info('Saving algo history to: {}'.format(str(save_directory)))
+    # Binary heap of [priority, count, item] entries with a label->entry index. Re-putting a label supersedes
+    # its old entry (lazy decrease-key): the old entry is marked stale and skipped when it reaches the top.
+    def __init__(self):
+        self.elements = []
+        self.entries = {}
+        self.stale_count = 0
+        self.stale_pops = 0
+        self._count = 0
 
-    # Create start and end nodes
-    start_node, end_node = graph.create_node(graph.start, None), graph.create_node(graph.end, None)
+    def __len__(self): return len(self.entries)
+
+    def __contains__(self, label): return label in self.entries
+
+    def __iter__(self): return (entry[2] for entry in self.entries.values())
+
+    def empty(self): return not self.entries
+
+    def get_item(self, label):
+        entry = self.entries.get(label)
+        return None if entry is None else entry[2]
+
+    def put(self, item, priority):
+        old_entry = self.entries.get(item.label)
+        if old_entry is not None:
+            old_entry[2] = None
+            self.stale_count += 1
+        entry = [priority, self._count, item]
+        self._count += 1
+        self.entries[item.label] = entry
+        heapq.heappush(self.elements, entry)
+        # Don't let stale entries dominate the heap
+        if self.stale_count > len(self.entries): self._compact()
+
+    def get(self):
+        while self.elements:
+            item = heapq.heappop(self.elements)[2]
+            if item is None:
+                self.stale_count -= 1
+                self.stale_pops += 1
+                continue
+            del self.entries[item.label]
+            return item
+        raise KeyError('get from an empty priority queue')
+
+    def min_priority(self):
+        # Priority of the next item get() would return (infinite if empty)
+        while self.elements and self.elements[0][2] is None:
+            heapq.heappop(self.elements)
+            self.stale_count -= 1
+            self.stale_pops += 1
+        return self.elements[0][0] if self.elements else math.inf
+
+    def _compact(self):
+        self.elements = [entry for entry in self.elements if entry[2] is not None]
+        heapq.heapify(self.elements)
+        self.stale_count = 0
+
+
+# The clock is only read every CLOCK_INTERVAL expansions when a time_limit is set
+CLOCK_INTERVAL = 64
+ARA_INITIAL_WEIGHT, ARA_WEIGHT_STEP = 3.0, 0.5
+
+
+def run_a_star(graph, heuristic_type, save_history = False, max_iterations=10**6, observer=None, weight=1.0, time_limit=None):
+    # Returns a SearchResult; its .solution is the old return value (the path, otherwise the iterations)
+
+    # If saving of algo history requested, record it in a timestamped directory
+    recorder = HistoryRecorder(new_history_directory(), graph) if save_history else None
+    if recorder and observer: observer = ObserverGroup([recorder, observer])
+    elif recorder: observer = recorder
+    try: return search_a_star(graph, heuristic_type, max_iterations, observer, weight, time_limit)
+    finally:
+        if recorder: recorder.close()
+
+
+def search_a_star(graph, heuristic_type, max_iterations=10**6, observer=None, weight=1.0, time_limit=None):
+    # Returns a SearchResult, which also unpacks as (label path or None, iterations). The observer (a SearchObserver)
+    # is told of every expansion and push; the counters are plain integers, so they are always collected. With
+    # weight > 1 (weighted A*) nodes are ordered by g + weight*h, trading optimality for fewer expansions: with a
+    # consistent heuristic the path costs at most weight times the optimum. The search gives up after max_iterations
+    # expansions or time_limit seconds, returning the path to the last node expanded with no bound.
+    if weight < 1: raise Exception('The heuristic weight must be at least 1.')
+    setup_time = time.perf_counter()
+    deadline = None if time_limit is None else setup_time + time_limit
+    if observer: observer.started(graph)
+
+    # Graph methods are looked up once, and only wrapped in timers when the observer asks for call timings
+    create_node, find_neighbours, is_accessible = graph.create_node, graph.find_neighbours, graph.is_accessible
+    call_seconds, call_counts = {}, {}
+    if observer and observer.time_calls:
+        create_node = timed_call(create_node, 'create_node', call_seconds, call_counts)
+        find_neighbours = timed_call(find_neighbours, 'find_neighbours', call_seconds, call_counts)
+
+    # Create start and end nodes (the solver's nodes are built without validation, the graph's labels being trusted)
+    start_node, end_node = create_node(graph.start, -1, True), create_node(graph.end, -1, True)
     if not start_node.accessible or not end_node.accessible:
         raise Exception('Start and end nodes must both be accessible.')
 
-    # Initialize open and closed lists
-    open_list, closed_list = nic_misc.PriorityQueue(), []
+    # Initialize the open queue (indexed by label) and the closed set (label:node)
+    open_list, closed_list = IndexedPriorityQueue(), {}
 
     # Add the start node to the open_list
     open_list.put(start_node, 0)
+    if observer: observer.pushed(0, start_node)
 
-    # Stopping condition
-    iterations, max_iterations = 0, 10**6
+    iterations, pushed, peak_open = 0, 1, 1
+    status, final_node = UNREACHABLE, None
 
+    search_time = time.perf_counter()
     current_node = start_node
     while not open_list.empty():
-        # Save the current state if requested
-        if save_history: _save_history(save_directory, iterations, graph, current_node, open_list, closed_list)
-
-        iterations += 1
         # _logger.warning('{}% max iterations')
 
-        if iterations > max_iterations:
+        # Budgets are checked before counting the next expansion, so iterations never exceeds max_iterations
+        if iterations >= max_iterations:
             _logger.error('Exceeded max_iterations ({}), returning path so far.'.format(max_iterations))
-            return reconstruct_path(current_node)
+            status, final_node = MAX_ITERATIONS, current_node
+            break
+        if deadline is not None and not iterations % CLOCK_INTERVAL and time.perf_counter() > deadline:
+            _logger.error('Exceeded time_limit ({}s), returning path so far.'.format(time_limit))
+            status, final_node = TIME_LIMIT, current_node
+            break
+        iterations += 1
 
-        # Get the current node
+        # Get the current node - each label is popped at most once, superseded entries are skipped by the queue
         current_node = open_list.get()
-        closed_list.append(current_node)
+        closed_list[current_node.label] = current_node
+        # Record only the deltas of the search state if requested
+        if observer: observer.expanded(iterations, current_node)
 
         # Found the goal
         if current_node == end_node:
-            if save_history: _save_history(save_directory, iterations, graph, current_node, open_list, closed_list)
-            return reconstruct_path(current_node)
-
-        # Get accessible, neighbouring children nodes
-        children_labels = graph.find_neighbours(current_node.label)
-        children = [graph.create_node(label, current_node) for label in children_labels if graph.is_accessible(label)]
+            status, final_node = FOUND, current_node
+            break
 
-        for child in children:
-            # Skip child if in closed list
-            if child in closed_list: continue
+        # Get accessible, neighbouring children labels (handing their costs to the current node, which would
+        # otherwise load them itself)
+        neighbours = find_neighbours(current_node.label)
+        current_node.set_neighbours_costs(neighbours, trusted=True)
+        for label in neighbours:
+            # Skip child if in closed set (checked before paying for a node)
+            if label in closed_list or not is_accessible(label): continue
+            child = create_node(label, current_node.index, True)
 
-            # Find child's f, g, and h values
+            # Find child's g value
             child.g = current_node.g + current_node.get_cost_to_leave(child)
-            child.h = child.get_heuristic_dist(end_node, heuristic_type)
-            child.f = child.g + child.h
 
-            # Skip child if already in open list with a better g score, otherwise add the child to the open list
-            for priority_and_node in open_list.elements:
-                if priority_and_node[1] == child and child.g > priority_and_node[1].g: continue
-            # if len([open_node for open_node in open_list.elements if child.coords == open_node[1].coords and child.g > open_node[1].g]) > 0: continue
+            # Skip child if already in open queue with a better or equal g score, otherwise add the child to the
+            # open queue (superseding any worse entry for the same label)
+            queued_node = open_list.get_item(label)
+            if queued_node is not None and queued_node.g <= child.g: continue
+
+            # Find child's h and f values
+            child.h = child.get_heuristic_dist(end_node, heuristic_type)
+            child.f = child.g + weight*child.h
             open_list.put(child, child.f)
+            pushed += 1
+            if observer: observer.pushed(iterations, child)
+        if len(open_list) > peak_open: peak_open = len(open_list)
+
+    reconstruct_time = time.perf_counter()
+    path = None if final_node is None else reconstruct_path(final_node, closed_list, graph)
+    end_time = time.perf_counter()
+
+    result = SearchResult(path, iterations, status, 'a_star', pushed, open_list.stale_pops, peak_open,
+                          {'setup': search_time - setup_time, 'search': reconstruct_time - search_time,
+                           'reconstruct': end_time - reconstruct_time, 'total': end_time - setup_time},
+                          call_seconds, call_counts, weight if status == FOUND else None, weight)
+    if observer: observer.finished(result)
+    return result
+
+
+def run_anytime_a_star(graph, heuristic_type, initial_weight=ARA_INITIAL_WEIGHT, weight_step=ARA_WEIGHT_STEP,
+                       max_iterations=10**6, time_limit=None):
+    # Returns the best SearchResult anytime_a_star reaches within the budgets
+    result = None
+    for result in anytime_a_star(graph, heuristic_type, initial_weight, weight_step, max_iterations, time_limit): pass
+    return result
+
+
+def anytime_a_star(graph, heuristic_type, initial_weight=ARA_INITIAL_WEIGHT, weight_step=ARA_WEIGHT_STEP,
+                   max_iterations=10**6, time_limit=None):
+    # Anytime Repairing A* (ARA*, Likhachev et al.): a generator of SearchResults with successively cheaper paths and
+    # tighter suboptimality bounds. Each pass is a weighted A* that reuses the previous passes' g-values, re-expanding
+    # only the nodes whose g dropped (the inconsistent ones); the weight falls by weight_step per pass down to 1. The
+    # bound reported is min(weight, cost / the lowest g + h left to expand). It stops once the path is proven optimal,
+    # or when the budgets (shared by all passes) run out, yielding a final failed result only if no path was found.
+    if initial_weight < 1: raise Exception('The heuristic weight must be at least 1.')
+    start_time = time.perf_counter()
+    deadline = None if time_limit is None else start_time + time_limit
+    create_node, find_neighbours, is_accessible = graph.create_node, graph.find_neighbours, graph.is_accessible
+
+    # One node per label, holding its current g and h
+    nodes, target = {}, create_node(graph.end, -1, True)
+    def node_for(label):
+        node = nodes.get(label)
+        if node is None:
+            node = nodes[label] = create_node(label, -1, True)
+            node.g, node.h = math.inf, node.get_heuristic_dist(target, heuristic_type)
+        return node
+
+    start_node, end_node = node_for(graph.start), node_for(graph.end)
+    if not start_node.accessible or not end_node.accessible:
+        raise Exception('Start and end nodes must both be accessible.')
+    start_node.g = 0
+
+    weight, iterations, pushed, peak_open, stale_pops = initial_weight, 0, 1, 1, 0
+    open_list, closed, inconsistent = IndexedPriorityQueue(), set(), {}
+    open_list.put(start_node, weight*start_node.h)
+    found, found_g, found_bound = False, math.inf, math.inf
+    while True:
+        # Improve the path: expand while something could still beat the end's g under the current weight
+        status = FOUND
+        while open_list.min_priority() < end_node.g:
+            if iterations >= max_iterations: status = MAX_ITERATIONS
+            elif deadline is not None and not iterations % CLOCK_INTERVAL and time.perf_counter() > deadline: status = TIME_LIMIT
+            if status != FOUND: break
+            iterations += 1
+            current_node = open_list.get()
+            closed.add(current_node.label)
+            neighbours = find_neighbours(current_node.label)
+            current_node.set_neighbours_costs(neighbours, trusted=True)
+            for label in neighbours:
+                if not is_accessible(label): continue
+                child = node_for(label)
+                child_g = current_node.g + current_node.get_cost_to_leave(child)
+                if child_g >= child.g: continue
+                child.g, child.parent_index = child_g, current_node.index
+                if label in closed: inconsistent[label] = child
+                else:
+                    open_list.put(child, child.g + weight*child.h)
+                    pushed += 1
+            if len(open_list) > peak_open: peak_open = len(open_list)
+        stale_pops = open_list.stale_pops + stale_pops
+
+        if status != FOUND:
+            _logger.error('Exceeded {} after {} passes of ARA*.'.format(
+                'max_iterations ({})'.format(max_iterations) if status == MAX_ITERATIONS else 'time_limit ({}s)'.format(time_limit),
+                'an improving' if found else 'no'))
+            if not found: yield SearchResult(None, iterations, status, 'ara_star', pushed, stale_pops, peak_open,
+                                             {'total': time.perf_counter() - start_time}, weight=weight)
+            return
+        if end_node.g == math.inf:
+            yield SearchResult(None, iterations, UNREACHABLE, 'ara_star', pushed, stale_pops, peak_open,
+                               {'total': time.perf_counter() - start_time}, weight=weight)
+            return
 
-    return iterations
+        lowest_f = min((node.g + node.h for node in list(open_list) + list(inconsistent.values())), default=math.inf)
+        bound = float(max(1.0, min(weight, end_node.g/lowest_f if lowest_f > 0 else math.inf)))
+        # Passes that neither improved the path nor tightened the bound aren't reported
+        if not found or end_node.g < found_g or bound < found_bound:
+            yield SearchResult(reconstruct_path(end_node, nodes, graph), iterations, FOUND, 'ara_star', pushed, stale_pops,
+                               peak_open, {'total': time.perf_counter() - start_time}, bound=bound, weight=weight)
+        found, found_g, found_bound = True, end_node.g, bound
+        if bound == 1.0: return
 
+        # Next pass: lower the weight (at least to the bound already proven), requeue the inconsistent nodes and re-key
+        # the queue
+        weight = max(1.0, min(weight - weight_step, bound))
+        queued = list(open_list) + list(inconsistent.values())
+        open_list, closed, inconsistent = IndexedPriorityQueue(), set(), {}
+        for node in queued: open_list.put(node, node.g + weight*node.h)
 
-def _save_history(save_directory, iterations, graph, current_node, open_list, closed_list):
-    if not (save_directory / 'graph.dat').exists(): pickle.dump(graph, open(str(save_directory / 'graph.dat'), 'wb'))  # Just save maze once
-    pickle.dump(current_node, open(str(save_directory / '{}_current_node.dat'.format(iterations)), 'wb'))
-    pickle.dump(open_list, open(str(save_directory / '{}_open_list.dat'.format(iterations)), 'wb'))
-    pickle.dump(closed_list, open(str(save_directory / '{}_closed_list.dat'.format(iterations)), 'wb'))
 
 # if __name__ == '__main__':
 #     # Prepare a valid maze geometry
@@ -0,0 +1,203 @@
+import heapq
+import math
+import numpy as np
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+from grid_search import flat_costs, heuristic_array, passable_steps
+
+
+# Any-angle search (Theta* and Lazy Theta*, Nash et al.) on SquareGrids. Paths run in straight lines between cell
+# centres, and a line costs the cost of each cell it crosses times the length of line inside that cell, so a path is
+# returned as its waypoints. A line is blocked if it crosses a wall; touching a wall's corner doesn't block it, just as
+# diagonal steps may cut corners. Short lines are walked cell by cell, long ones costed together in one vectorised
+# pass, and line costs are cached per cell pair on the grid (see line_of_sight) until its version changes. Paths are
+# usually shorter than 8-connected ones, but aren't guaranteed to be the shortest.
+
+LINE_TOLERANCE = 1e-9   # lengths below this are where a line passes exactly through a cell corner
+LONG_LINE = 48          # lines crossing more grid lines than this are costed in a vectorised batch, shorter ones walked
+
+
+def line_cells(starts, ends):
+    # Cells crossed by the lines between the centres of cells starts[i] and ends[i] ((n, 2) arrays of row, col
+    # labels), worked out for all the lines at once. Returns (lines, rows, cols, lengths) arrays, one entry per piece of
+    # line. Each line is split where it crosses grid lines - the k-th of n crossings in a direction is (k - 1/2)/n of the
+    # way along - and each piece is assigned to the cell holding its midpoint.
+    starts, ends = np.asarray(starts, dtype=np.int64).reshape(-1, 2), np.asarray(ends, dtype=np.int64).reshape(-1, 2)
+    deltas = ends - starts
+    n_lines = len(starts)
+    fractions, lines = [np.zeros(n_lines), np.ones(n_lines)], [np.arange(n_lines)]*2
+    for axis in (0, 1):
+        n_crossings = np.abs(deltas[:, axis])
+        crossing_lines = np.repeat(np.arange(n_lines), n_crossings)
+        k = np.arange(crossing_lines.size) - np.repeat(np.cumsum(n_crossings) - n_crossings, n_crossings) + 1
+        fractions.append((k - 0.5)/n_crossings[crossing_lines])
+        lines.append(crossing_lines)
+    fractions, lines = np.concatenate(fractions), np.concatenate(lines)
+    order = np.lexsort((fractions, lines))
+    fractions, lines = fractions[order], lines[order]
+
+    pieces = np.diff(fractions)
+    inside = (lines[1:] == lines[:-1]) & (pieces > LINE_TOLERANCE)
+    lines, middles = lines[1:][inside], (fractions[1:] + fractions[:-1])[inside]/2
+    rows = np.floor(starts[lines, 0] + 0.5 + middles*deltas[lines, 0]).astype(np.int64)
+    cols = np.floor(starts[lines, 1] + 0.5 + middles*deltas[lines, 1]).astype(np.int64)
+    return lines, rows, cols, pieces[inside]*np.hypot(deltas[lines, 0], deltas[lines, 1])
+
+
+class LineOfSight:
+
+    def __init__(self, grid, max_entries=10**6):
+        self.grid, self.max_entries = grid, max_entries
+        self.version = None
+        self.sync()
+
+    def sync(self):
+        # Drop cached lines if the grid has changed since they were worked out
+        if self.version == self.grid.version: return
+        self.costs = flat_costs(self.grid)
+        self.width = self.grid.dimensions[1]
+        self._costs_2d = self.costs.reshape(self.grid.dimensions)
+        self._cost_list = self.costs.tolist()
+        self._lines = {}
+        self.version = self.grid.version
+
+    def cost(self, a, b):
+        key = (a, b) if a < b else (b, a)
+        cost = self._lines.get(key)
+        if cost is None: cost = self.costs_from(a, [b])[0]
+        return cost
+
+    def costs_from(self, a, targets):
+        # Costs of the lines from flat index a to each of targets (infinite if blocked)
+        costs, lines = self._lines, []
+        results = [costs.get((a, b) if a < b else (b, a)) for b in targets]
+        uncached = [i for i, cost in enumerate(results) if cost is None]
+        if not uncached: return results
+        if len(costs) + len(uncached) > self.max_entries: costs.clear()
+
+        width, cost_list = self.width, self._cost_list
+        row_a, col_a = divmod(a, width)
+        for i in uncached:
+            row_b, col_b = divmod(targets[i], width)
+            if abs(row_a - row_b) + abs(col_a - col_b) > LONG_LINE: lines.append((i, row_b, col_b))
+            else: results[i] = self._walk_line(row_a, col_a, row_b, col_b)
+        if lines:
+            line_ids, rows, cols, lengths = line_cells([(row_a, col_a)]*len(lines), [line[1:] for line in lines])
+            cell_costs = self._costs_2d[rows, cols]
+            line_costs = np.bincount(line_ids, weights=cell_costs*lengths, minlength=len(lines))
+            line_costs[np.bincount(line_ids, weights=cell_costs == 0, minlength=len(lines)) > 0] = np.inf
+            for (i, _, _), line_cost in zip(lines, line_costs.tolist()): results[i] = line_cost
+        for i in uncached:
+            b = targets[i]
+            costs[(a, b) if a < b else (b, a)] = results[i]
+        return results
+
+    def _walk_line(self, row_a, col_a, row_b, col_b):
+        # Steps cell to cell along the line, comparing the next row crossing (2i+1)/(2 n_row) of the way along with the
+        # next column crossing (2j+1)/(2 n_col) exactly, so a line through a corner steps straight across it
+        cost_list, width = self._cost_list, self.width
+        d_row, d_col = row_b - row_a, col_b - col_a
+        n_row, n_col = abs(d_row), abs(d_col)
+        row_step, col_step = (width if d_row > 0 else -width), (1 if d_col > 0 else -1)
+        index, total, t, i, j = row_a*width + col_a, 0.0, 0.0, 0, 0
+        while True:
+            cost = cost_list[index]
+            if cost == 0: return np.inf
+            row_next = i < n_row and (j >= n_col or (2*i + 1)*n_col <= (2*j + 1)*n_row)
+            col_next = j < n_col and (i >= n_row or (2*j + 1)*n_row <= (2*i + 1)*n_col)
+            if not row_next and not col_next: return (total + cost*(1 - t))*math.hypot(d_row, d_col)
+            t_next = (2*i + 1)/(2*n_row) if row_next else (2*j + 1)/(2*n_col)
+            total += cost*(t_next - t)
+            if row_next: index, i = index + row_step, i + 1
+            if col_next: index, j = index + col_step, j + 1
+            t = t_next
+
+
+def line_of_sight(grid):
+    # The grid's LineOfSight, kept on the grid between searches
+    if grid.sight_lines is None: grid.sight_lines = LineOfSight(grid)
+    grid.sight_lines.sync()
+    return grid.sight_lines
+
+
+def reconstruct_waypoints(parents, index, width):
+    path = []
+    while index != -1:
+        path.append(divmod(int(index), width))
+        index = parents[index]
+    return path[::-1]
+
+
+def search_theta_star(grid, lazy=True, max_iterations=10**6):
+    # Returns (label waypoint path or None, iterations). Theta* checks the lines from the current cell's parent to its
+    # children as they are pushed (all at once); Lazy Theta* assumes the lines are clear and only checks one when its
+    # child is expanded, falling back on the best expanded neighbour if it is blocked.
+
+    height, width = grid.dimensions
+    sight = line_of_sight(grid)
+    costs = sight.costs
+    start, end = grid.label_to_index(grid.start), grid.label_to_index(grid.end)
+    if costs[start] == 0 or costs[end] == 0: raise Exception('Start and end nodes must both be accessible.')
+
+    # Straight-line distance at the cheapest cell cost never overestimates a line's cost. With varying cell costs a
+    # clear line's cost isn't known from its length, so Lazy Theta* only defers line checks on uniform-cost grids.
+    min_cost = costs[costs != 0].min()
+    lazy = lazy and costs[costs != 0].max() == min_cost
+    h = heuristic_array(grid.dimensions, grid.end, 'euclidian')*min_cost
+    steps = passable_steps(grid, costs)
+
+    g = np.full(height*width, np.inf)
+    parents = np.full(height*width, -1, dtype=np.int64)
+    closed = np.zeros(height*width, dtype=bool)
+
+    g[start] = 0
+    open_heap, count = [(0, 0, start)], 1
+    iterations, current = 0, start
+    while open_heap:
+        current = heapq.heappop(open_heap)[2]
+        if closed[current]: continue
+
+        iterations += 1
+        if iterations > max_iterations:
+            _logger.error('Exceeded max_iterations ({}), returning path so far.'.format(max_iterations))
+            return reconstruct_waypoints(parents, current, width), iterations
+
+        closed[current] = True
+        if lazy and current != start: _set_vertex(current, g, parents, closed, steps, sight)
+        if current == end: return reconstruct_waypoints(parents, current, width), iterations
+
+        parent = int(parents[current])
+        current_g = g[current]
+        children = [current + offset for offset, distance, passable in steps if passable[current] and not closed[current + offset]]
+        if not children: continue
+        step_costs = sight.costs_from(current, children)
+        # Path 2 (straight from the current cell's parent) if the line is clear and cheaper (cell costs vary, so it may
+        # not be), else path 1 (via the current cell). Lazily, path 2 is taken on trust and costed by its length.
+        if parent == -1: line_costs = [np.inf]*len(children)
+        elif lazy:
+            row_p, col_p = divmod(parent, width)
+            line_costs = [min_cost*math.hypot(child//width - row_p, child % width - col_p) for child in children]
+        else: line_costs = sight.costs_from(parent, children)
+        parent_g = g[parent]
+        for child, step_cost, line_cost in zip(children, step_costs, line_costs):
+            child_parent, child_g = current, current_g + step_cost
+            if parent_g + line_cost <= child_g: child_parent, child_g = parent, parent_g + line_cost
+            if child_g >= g[child]: continue
+            g[child], parents[child] = child_g, child_parent
+            heapq.heappush(open_heap, (child_g + h[child], count, child))
+            count += 1
+
+    return None, iterations
+
+
+def _set_vertex(index, g, parents, closed, steps, sight):
+    # Lazy Theta*: cost the assumed line from the parent, and take the best expanded neighbour instead if it is
+    # blocked or dearer
+    best_parent = int(parents[index])
+    neighbours = [index + offset for offset, distance, passable in steps if passable[index] and closed[index + offset]]
+    best_g = g[best_parent] + sight.cost(best_parent, index)
+    for neighbour, step_cost in zip(neighbours, sight.costs_from(index, neighbours)):
+        if g[neighbour] + step_cost < best_g: best_parent, best_g = neighbour, g[neighbour] + step_cost
+    g[index], parents[index] = best_g, best_parent
@@ -0,0 +1,125 @@
+import os
+import numpy as np
+from copy import copy
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+import grid_search
+import jump_point
+import network_search
+from geometry import Network, SquareGrid, HexGrid
+
+
+# Batch solving of many (start, end) queries against one graph, fanned out over a process pool. The graph's arrays
+# (maze_array, or the Network CSR arrays) are copied once into shared memory and each worker builds a lightweight
+# graph from them (grids take their own copy of maze_array, see SquareGrid.set_maze_array), so only the (start, end)
+# pairs are pickled per task.
+
+# Per-worker state, set by _init_worker
+_worker_graph = None
+_worker_method = None
+_worker_shared_memory = []
+
+
+def _grid_search(grid, max_iterations): return grid_search.search_grid(grid, grid.heuristic_type, max_iterations)
+
+def _jump_point_search(grid, max_iterations): return jump_point.search_jump_points(grid, grid.heuristic_type, max_iterations)
+
+def _grid_bidirectional(grid, max_iterations): return grid_search.search_grid_bidirectional(grid, grid.heuristic_type, max_iterations)
+
+_SOLVERS = {SquareGrid: {'grid_a_star': _grid_search, 'jps': _jump_point_search, 'bidirectional': _grid_bidirectional},
+            HexGrid: {'grid_a_star': _grid_search, 'bidirectional': _grid_bidirectional},
+            Network: {'dijkstra': network_search.search_network, 'bidirectional': network_search.search_network_bidirectional}}
+_DEFAULT_METHODS = {SquareGrid: 'grid_a_star', HexGrid: 'grid_a_star', Network: 'dijkstra'}
+
+
+def solve_batch(graph, pairs, method=None, processes=None, chunksize=None, max_iterations=10**6):
+    # Returns a list of (label path or None, iterations), in the same order as pairs. An invalid pair (e.g. a start on a
+    # wall) is logged and gets (None, 0), without affecting the other queries.
+    graph_type = type(graph)
+    if graph_type not in _SOLVERS: raise Exception('Batch solving is not supported for {}.'.format(graph_type.__name__))
+    method = _DEFAULT_METHODS[graph_type] if method is None else method
+    if method not in _SOLVERS[graph_type]:
+        raise Exception('Unknown batch method \'{}\' for a {}.'.format(method, graph_type.__name__))
+
+    pairs = list(pairs)
+    processes = os.cpu_count() if processes is None else processes
+    if processes <= 1 or len(pairs) <= 1:
+        # Queries run on a shallow copy, so the caller's start and end are left alone
+        solver, query_graph = _SOLVERS[graph_type][method], copy(graph)
+        return [_solve_pair(query_graph, solver, start, end, max_iterations) for start, end in pairs]
+
+    arrays, graph_args = _graph_arrays(graph)
+    shared_memories, shared_specs = [], []
+    try:
+        for array in arrays:
+            shared_memory = SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared_memories.append(shared_memory)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shared_memory.buf)[...] = array
+            shared_specs.append((shared_memory.name, array.shape, array.dtype.str))
+
+        chunksize = max(1, len(pairs) // (processes*4)) if chunksize is None else chunksize
+        _logger.info('Solving {} queries with {} processes.'.format(len(pairs), processes))
+        with Pool(processes, initializer=_init_worker, initargs=(graph_type, graph_args, shared_specs, method)) as pool:
+            return pool.map(_solve_worker_pair, [(start, end, max_iterations) for start, end in pairs], chunksize)
+    finally:
+        for shared_memory in shared_memories:
+            shared_memory.close()
+            shared_memory.unlink()
+
+
+def _graph_arrays(graph):
+    # Returns the arrays to share, and the small picklable arguments needed to rebuild the graph around them. Graphs
+    # still matching the binary file they were loaded from share nothing: each worker memory-maps the file again.
+    graph_file = graph.loaded_from_file()
+    if isinstance(graph, HexGrid):
+        if graph_file: return [], (graph.heuristic_type, graph.orientation, graph_file)
+        return [np.ascontiguousarray(graph.maze_array)], (graph.heuristic_type, graph.orientation, None)
+    if isinstance(graph, SquareGrid):
+        if graph_file: return [], (graph.heuristic_type, graph._diagonality, graph_file)
+        return [np.ascontiguousarray(graph.maze_array)], (graph.heuristic_type, graph._diagonality, None)
+    if graph_file: return [], (None, graph_file)
+    return [graph.indptr, graph.indices, graph.costs], (graph.labels, None)
+
+
+def _init_worker(graph_type, graph_args, shared_specs, method):
+    global _worker_graph, _worker_method
+    arrays = []
+    for name, shape, dtype in shared_specs:
+        shared_memory = SharedMemory(name=name)
+        _worker_shared_memory.append(shared_memory)
+        arrays.append(np.ndarray(shape, dtype=np.dtype(dtype), buffer=shared_memory.buf))
+
+    if graph_type is HexGrid:
+        heuristic_type, orientation, graph_file = graph_args
+        if graph_file: _worker_graph = HexGrid(heuristic_type, orientation=orientation, graph_filename=graph_file)
+        else: _worker_graph = HexGrid(heuristic_type, orientation=orientation, maze_array=arrays[0])
+    elif graph_type is SquareGrid:
+        heuristic_type, diagonality, graph_file = graph_args
+        if graph_file: _worker_graph = SquareGrid(heuristic_type, diagonality=diagonality, graph_filename=graph_file)
+        else: _worker_graph = SquareGrid(heuristic_type, diagonality=diagonality, maze_array=arrays[0])
+    else:
+        labels, graph_file = graph_args
+        if graph_file: _worker_graph = Network(graph_filename=graph_file)
+        else: _worker_graph = Network(adjacency=(labels, *arrays))
+    _worker_method = _SOLVERS[graph_type][method]
+
+
+def _solve_worker_pair(query):
+    start, end, max_iterations = query
+    return _solve_pair(_worker_graph, _worker_method, start, end, max_iterations)
+
+
+def _solve_pair(graph, solver, start, end, max_iterations):
+    try:
+        graph.start, graph.end = (), ()
+        graph.set_start(start)
+        graph.set_end(end)
+        graph.check_graph()
+        return solver(graph, max_iterations)
+    except Exception as error:
+        _logger.error('Failed to solve the query from {} to {}: {}'.format(start, end, error))
+        return None, 0
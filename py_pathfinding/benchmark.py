@@ -0,0 +1,211 @@
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+import a_star
+import any_angle
+import contraction
+import generators
+import grid_search
+import hierarchical
+import incremental
+import jump_point
+import network_search
+from geometry import Network, SquareGrid, connected_components
+
+
+# Benchmark harness: times every solve method on seeded generated graphs of increasing size and writes the results as
+# JSON, so runs from different versions can be compared with compare_results. Each mode calls the search function
+# that SquareGrid.solve/Network.solve dispatches to (which also reports expansions); one-off preprocessing (HPA*
+# clusters, contraction hierarchies) is timed separately. Peak memory is traced over a second run of the first query,
+# so tracing doesn't slow the timed runs.
+
+DEFAULT_SIZES = [10**2, 10**3, 10**4, 10**5, 10**6, 10**7]
+RESULTS_DIRECTORY = 'benchmark_results'
+
+
+def _hpa_search(grid, max_iterations): return grid.hierarchy.search(grid.start, grid.end)
+
+def _d_star_lite_search(grid, max_iterations):
+    planner = incremental.DStarLite(grid, max_iterations=max_iterations)
+    return planner.plan(), planner.iterations
+
+def _ch_search(network, max_iterations): return network.contraction.search(network.start, network.end)
+
+def _build_hierarchy(grid): grid.hierarchy = hierarchical.ClusterAbstraction(grid)
+
+def _build_contraction(network): network.contraction = contraction.ContractionHierarchy(network)
+
+def _build_landmarks(network): network.build_landmarks()
+
+# mode: (search(graph, max_iterations) -> (path or None, iterations), preprocessing(graph) or None)
+GRID_MODES = {'a_star': (lambda grid, max_iterations: a_star.search_a_star(grid, grid.heuristic_type, max_iterations), None),
+              'grid_a_star': (lambda grid, max_iterations: grid_search.search_grid(grid, grid.heuristic_type, max_iterations), None),
+              'jps': (lambda grid, max_iterations: jump_point.search_jump_points(grid, grid.heuristic_type, max_iterations), None),
+              'hpa': (_hpa_search, _build_hierarchy),
+              'd_star_lite': (_d_star_lite_search, None),
+              'bidirectional': (lambda grid, max_iterations: grid_search.search_grid_bidirectional(grid, grid.heuristic_type, max_iterations), None),
+              'ara_star': (lambda grid, max_iterations: a_star.run_anytime_a_star(grid, grid.heuristic_type, max_iterations=max_iterations), None),
+              'theta_star': (lambda grid, max_iterations: any_angle.search_theta_star(grid, False, max_iterations), None),
+              'lazy_theta_star': (lambda grid, max_iterations: any_angle.search_theta_star(grid, True, max_iterations), None)}
+NETWORK_MODES = {'a_star': (lambda network, max_iterations: a_star.search_a_star(network, None, max_iterations), None),
+                 'alt': (lambda network, max_iterations: a_star.search_a_star(network, 'alt', max_iterations), _build_landmarks),
+                 'ara_star': (lambda network, max_iterations: a_star.run_anytime_a_star(network, 'alt', max_iterations=max_iterations), _build_landmarks),
+                 'dijkstra': (network_search.search_network, None),
+                 'bidirectional': (network_search.search_network_bidirectional, None),
+                 'ch': (_ch_search, _build_contraction)}
+
+# Modes returning any-angle waypoint paths, costed by SquareGrid.line_path_cost
+ANY_ANGLE_MODES = ('theta_star', 'lazy_theta_star')
+
+# Largest graphs (in nodes) each mode, or (graph type, mode), is run on; larger cases are recorded as skipped. The
+# object-based A* modes and the pure Python preprocessing steps are too slow beyond these, and a generated network
+# takes about 1GB per million places, so only the grid array engines run at 10**7.
+MODE_MAX_NODES = {'a_star': 10**5, 'ara_star': 10**5, 'alt': 10**5, 'hpa': 10**6, 'd_star_lite': 10**6, 'ch': 10**5,
+                  ('network', 'dijkstra'): 10**6, ('network', 'bidirectional'): 10**6}
+
+
+def make_grid(generator, n_nodes, seed, heuristic_type='euclidian', diagonality=True):
+    side = max(2, int(round(np.sqrt(n_nodes))))
+    return SquareGrid(heuristic_type, diagonality=diagonality, maze_array=generators.GRID_GENERATORS[generator](side, side, seed=seed))
+
+
+def make_network(generator, n_nodes, seed):
+    return Network(adjacency=generators.NETWORK_GENERATORS[generator](n_nodes, seed=seed))
+
+
+def pick_queries(graph, n_queries, seed):
+    # Random (start, end) label pairs within the largest connected component
+    rng = np.random.default_rng(seed)
+    if isinstance(graph, SquareGrid):
+        height, width = graph.dimensions
+        accessible = np.asarray(graph.maze_array).ravel() != 0
+        ids = np.arange(height*width).reshape(height, width)
+        edges = [(ids[:, :-1], ids[:, 1:]), (ids[:-1, :], ids[1:, :])]
+        if graph._diagonality: edges += [(ids[:-1, :-1], ids[1:, 1:]), (ids[:-1, 1:], ids[1:, :-1])]
+        sources = np.concatenate([source.ravel() for source, _ in edges])
+        targets = np.concatenate([target.ravel() for _, target in edges])
+        open_edges = accessible[sources] & accessible[targets]
+        components = connected_components(height*width, sources[open_edges], targets[open_edges])
+        components[~accessible] = -1
+    else:
+        components = graph.find_components()
+    roots, sizes = np.unique(components[components != -1], return_counts=True)
+    members = np.flatnonzero(components == roots[np.argmax(sizes)])
+    if members.size < 2: return []
+    return [tuple(graph.index_to_label(index) for index in rng.choice(members, 2, replace=False)) for _ in range(n_queries)]
+
+
+def benchmark_graph(graph, mode, queries, max_iterations=10**6, measure_memory=True):
+    search, preprocessing = (GRID_MODES if isinstance(graph, SquareGrid) else NETWORK_MODES)[mode]
+    result = {'mode': mode, 'queries': len(queries), 'preprocess_seconds': 0.0}
+    if preprocessing:
+        start_time = time.perf_counter()
+        preprocessing(graph)
+        result['preprocess_seconds'] = time.perf_counter() - start_time
+
+    path_cost = graph.line_path_cost if mode in ANY_ANGLE_MODES else graph.path_cost
+    seconds, expansions, costs, found = 0.0, 0, [], 0
+    for start, end in queries:
+        graph.start, graph.end = start, end
+        start_time = time.perf_counter()
+        path, iterations = search(graph, max_iterations)
+        seconds += time.perf_counter() - start_time
+        # The array engines return max_iterations + 1 when they run out of budget
+        expansions += min(iterations, max_iterations)
+        if path is not None and path[-1] == end:
+            found += 1
+            costs.append(path_cost(path))
+
+    if measure_memory and queries:
+        graph.start, graph.end = queries[0]
+        tracemalloc.start()
+        search(graph, max_iterations)
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    result.update({'seconds': seconds, 'expansions': expansions, 'found': found,
+                   'expansions_per_second': expansions/seconds if seconds else None,
+                   'mean_path_cost': float(np.mean(costs)) if costs else None,
+                   'path_costs': [float(cost) for cost in costs]})
+    return result
+
+
+def run_benchmarks(sizes=None, grid_generators=None, network_generators=None, grid_modes=None, network_modes=None,
+                   n_queries=10, seed=0, max_iterations=10**6, measure_memory=True, output_filename=None):
+    # Runs every (generator, size, mode) case and saves the results as JSON; returns the results dict
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+    grid_generators = generators.GRID_GENERATORS if grid_generators is None else grid_generators
+    network_generators = generators.NETWORK_GENERATORS if network_generators is None else network_generators
+    grid_modes = GRID_MODES if grid_modes is None else grid_modes
+    network_modes = NETWORK_MODES if network_modes is None else network_modes
+    cases = [('grid', generator, grid_modes) for generator in grid_generators]
+    cases += [('network', generator, network_modes) for generator in network_generators]
+
+    results = []
+    for graph_type, generator, modes in cases:
+        for n_nodes in sizes:
+            for mode in modes:
+                case = {'graph': graph_type, 'generator': generator, 'nodes': n_nodes, 'seed': seed}
+                if n_nodes > MODE_MAX_NODES.get((graph_type, mode), MODE_MAX_NODES.get(mode, np.inf)):
+                    results.append(dict(case, mode=mode, skipped='larger than MODE_MAX_NODES'))
+                    continue
+                # A fresh graph per mode, so no mode benefits from another's cached state
+                graph = make_grid(generator, n_nodes, seed) if graph_type == 'grid' else make_network(generator, n_nodes, seed)
+                queries = pick_queries(graph, n_queries, seed)
+                try: result = benchmark_graph(graph, mode, queries, max_iterations, measure_memory)
+                except Exception as error:
+                    results.append(dict(case, mode=mode, skipped=str(error)))
+                    continue
+                results.append(dict(case, **result))
+                _logger.info('{} {} {} nodes, {}: {:.3f}s, {} expansions.'.format(
+                    graph_type, generator, n_nodes, mode, result['seconds'], result['expansions']))
+
+    report = {'created': datetime.now().isoformat(), 'commit': _git_commit(), 'python': platform.python_version(),
+              'numpy': np.__version__, 'machine': platform.platform(), 'results': results}
+    output_filename = Path(RESULTS_DIRECTORY)/'{}.json'.format(datetime.now().strftime('%Y-%m-%d_%H_%M_%S')) if output_filename is None else Path(output_filename)
+    output_filename.parent.mkdir(parents=True, exist_ok=True)
+    with open(str(output_filename), 'w') as file: json.dump(report, file, indent=1)
+    _logger.info('Saved benchmark results to {}.'.format(output_filename))
+    return report
+
+
+def _git_commit():
+    try: return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception: return None
+
+
+def compare_results(baseline_filename, filename, tolerance=0.2, min_seconds=0.05):
+    # Lists the cases that got slower (expansions per second down by more than tolerance), expanded more or found
+    # different path costs between two results files. Speeds of cases quicker than min_seconds are too noisy to compare.
+    with open(str(baseline_filename)) as file: baseline = json.load(file)
+    with open(str(filename)) as file: current = json.load(file)
+    key = lambda result: (result['graph'], result['generator'], result['nodes'], result['seed'], result['mode'])
+    baseline_results = {key(result): result for result in baseline['results'] if 'skipped' not in result}
+
+    regressions = []
+    for result in current['results']:
+        old = baseline_results.get(key(result))
+        if old is None or 'skipped' in result: continue
+        if min(old['seconds'], result['seconds']) >= min_seconds and old['expansions_per_second'] and \
+                result['expansions_per_second'] < (1 - tolerance)*old['expansions_per_second']:
+            regressions.append((key(result), 'expansions per second', old['expansions_per_second'], result['expansions_per_second']))
+        if result['expansions'] > (1 + tolerance)*old['expansions']:
+            regressions.append((key(result), 'expansions', old['expansions'], result['expansions']))
+        if len(old['path_costs']) != len(result['path_costs']) or not np.allclose(old['path_costs'], result['path_costs']):
+            regressions.append((key(result), 'path costs', old['mean_path_cost'], result['mean_path_cost']))
+    for regression in regressions: _logger.warning('Regression in {}: {} {} -> {}'.format(*regression))
+    return regressions
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_benchmarks()
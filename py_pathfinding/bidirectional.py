@@ -0,0 +1,67 @@
+import heapq
+import math
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+
+# Bidirectional A*/Dijkstra over flat node indices, shared by the grid and network engines. The two searches use the
+# average potential p(v) = (h_end(v) - h_start(v))/2 forwards and -p(v) backwards, which keeps both consistent, so the
+# search can stop as soon as the two top keys together reach the cost mu of the best meeting found so far: the path
+# through the meeting point is then optimal. With no heuristic this is plain bidirectional Dijkstra.
+
+def search_bidirectional(size, start, end, forward_edges, backward_edges, potential=None, max_iterations=10**6):
+    # forward_edges(i) and backward_edges(i) return (neighbour, cost) pairs for the edges leaving and entering node i.
+    # Returns (index path or None, iterations).
+    if start == end: return [start], 0
+    potential = potential if potential is not None else [0.0]*size
+
+    g = ([math.inf]*size, [math.inf]*size)
+    parents = ([-1]*size, [-1]*size)
+    closed = ([False]*size, [False]*size)
+    heaps = ([(potential[start], start)], [(-potential[end], end)])
+    edges, signs = (forward_edges, backward_edges), (1, -1)
+    g[0][start], g[1][end] = 0, 0
+
+    mu, meeting, iterations = math.inf, -1, 0
+    while True:
+        for side in (0, 1):
+            heap, side_closed = heaps[side], closed[side]
+            while heap and side_closed[heap[0][1]]: heapq.heappop(heap)
+        if not heaps[0] or not heaps[1] or heaps[0][0][0] + heaps[1][0][0] >= mu: break
+
+        iterations += 1
+        if iterations > max_iterations:
+            # There is no single partial path to return from two half-searches
+            _logger.error('Exceeded max_iterations ({}) in bidirectional search.'.format(max_iterations))
+            return None, iterations
+
+        # Grow the side with the smaller frontier
+        side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+        side_g, other_g, side_parents, sign = g[side], g[1-side], parents[side], signs[side]
+        current = heapq.heappop(heaps[side])[1]
+        closed[side][current] = True
+        current_g = side_g[current]
+        for neighbour, cost in edges[side](current):
+            neighbour_g = current_g + cost
+            if neighbour_g < side_g[neighbour]:
+                side_g[neighbour], side_parents[neighbour] = neighbour_g, current
+                heapq.heappush(heaps[side], (neighbour_g + sign*potential[neighbour], neighbour))
+            if neighbour_g + other_g[neighbour] < mu: mu, meeting = neighbour_g + other_g[neighbour], neighbour
+
+    if meeting == -1: return None, iterations
+
+    path, node = [], meeting
+    while node != -1:
+        path.append(node)
+        node = parents[0][node]
+    path, node = path[::-1], parents[1][meeting]
+    while node != -1:
+        path.append(node)
+        node = parents[1][node]
+    return path, iterations
+
+
+def average_potential(h_end, h_start):
+    # Forward potential from estimates of the cost to the end and from the start (backward potential is its negation)
+    return ((h_end - h_start)/2).tolist()
@@ -0,0 +1,201 @@
+import hashlib
+import heapq
+import math
+import numpy as np
+from pathlib import Path
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+
+# Contraction Hierarchies for static Networks. Places are contracted one at a time in order of importance (edge
+# difference, contracted neighbours and depth in the hierarchy, with lazy priority updates); contracting a place adds
+# a shortcut between two of its neighbours unless a bounded witness search finds a path around it that is no longer.
+# Every place then keeps only its edges up to higher-ranked places, and a query runs Dijkstra upwards from both ends
+# (with stall-on-demand) and unpacks shortcuts through their middle places. Edges are symmetric, so one upward graph
+# serves both directions.
+
+WITNESS_SETTLE_LIMIT = 60
+CONTRACTION_SUFFIX = '.ch.npz'    # hierarchies saved next to a binary network file, see Network.save_binary
+
+
+def network_fingerprint(network):
+    digest = hashlib.sha1()
+    for array in (network.indptr, network.indices, network.costs): digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+class ContractionHierarchy:
+
+    def __init__(self, network, build=True):
+        self.network = network
+        self.rank = None
+        self.up = []    # node ID: [(higher-ranked neighbour, cost, middle node ID or -1 for an original edge)]
+        if build: self.build()
+
+    def build(self):
+        network = self.network
+        n_nodes = len(network.labels)
+        # Remaining (uncontracted) graph: node ID: {neighbour: cost}, with the middle node of each shortcut
+        remaining, middles = [{} for _ in range(n_nodes)], {}
+        sources = np.repeat(np.arange(n_nodes), np.diff(network.indptr)).tolist()
+        for source, target, cost in zip(sources, network.indices.tolist(), network.costs.tolist()):
+            if cost < remaining[source].get(target, math.inf): remaining[source][target] = cost
+        self._remaining = remaining
+        self._contracted_neighbours = [0]*n_nodes
+        self._depth = [0]*n_nodes
+
+        queue = [(self._simulate(node)[0], node) for node in range(n_nodes)]
+        heapq.heapify(queue)
+        rank, self.up = [0]*n_nodes, [None]*n_nodes
+        n_shortcuts, order = 0, 0
+        while queue:
+            _, node = heapq.heappop(queue)
+            # Lazy update: contract only if the node is still the cheapest after recomputing its priority
+            priority, shortcuts = self._simulate(node)
+            if queue and priority > queue[0][0]:
+                heapq.heappush(queue, (priority, node))
+                continue
+            neighbours = remaining[node]
+            self.up[node] = [(neighbour, cost, middles.get((node, neighbour), -1)) for neighbour, cost in neighbours.items()]
+            rank[node], order = order, order + 1
+            for neighbour in neighbours:
+                del remaining[neighbour][node]
+                self._contracted_neighbours[neighbour] += 1
+                self._depth[neighbour] = max(self._depth[neighbour], self._depth[node] + 1)
+            for source, target, cost in shortcuts:
+                if cost < remaining[source].get(target, math.inf):
+                    remaining[source][target] = remaining[target][source] = cost
+                    middles[source, target] = middles[target, source] = node
+                    n_shortcuts += 1
+            remaining[node] = {}
+        self.rank = rank
+        del self._remaining, self._contracted_neighbours, self._depth
+        _logger.info('Built contraction hierarchy over {} places with {} shortcuts.'.format(n_nodes, n_shortcuts))
+
+    def _simulate(self, node):
+        # Returns (priority, shortcuts) for contracting the node now
+        shortcuts = self._shortcuts(node)
+        return len(shortcuts) - len(self._remaining[node]) + self._contracted_neighbours[node] + self._depth[node], shortcuts
+
+    def _shortcuts(self, node):
+        # Shortcuts (source, target, cost) needed between the node's remaining neighbours if it were contracted
+        neighbours = list(self._remaining[node].items())
+        shortcuts = []
+        for i, (source, source_cost) in enumerate(neighbours[:-1]):
+            targets = {target: source_cost + cost for target, cost in neighbours[i+1:]}
+            witnessed = self._witness_search(source, node, targets)
+            shortcuts += [(source, target, cost) for target, cost in targets.items() if witnessed.get(target, math.inf) > cost]
+        return shortcuts
+
+    def _witness_search(self, source, excluded, targets):
+        # Bounded Dijkstra from source avoiding the node being contracted; returns the distances found to targets
+        remaining, limit = self._remaining, max(targets.values())
+        distances, found = {source: 0}, {}
+        open_heap, settled = [(0, source)], 0
+        while open_heap and settled < WITNESS_SETTLE_LIMIT and len(found) < len(targets):
+            distance, current = heapq.heappop(open_heap)
+            if distance > distances[current]: continue
+            if distance > limit: break
+            settled += 1
+            if current in targets: found[current] = distance
+            for neighbour, cost in remaining[current].items():
+                neighbour_distance = distance + cost
+                if neighbour_distance <= limit and neighbour != excluded and neighbour_distance < distances.get(neighbour, math.inf):
+                    distances[neighbour] = neighbour_distance
+                    heapq.heappush(open_heap, (neighbour_distance, neighbour))
+        # Tentative distances to unsettled targets are still valid (if longer) witnesses
+        for target in targets:
+            if target not in found and target in distances: found[target] = distances[target]
+        return found
+
+    def save(self, filename):
+        # Upward edges as CSR arrays, plus the labels and a fingerprint of the network they were built from
+        counts = [len(edges) for edges in self.up]
+        edges = [edge for node_edges in self.up for edge in node_edges]
+        indptr = np.zeros(len(self.up) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        np.savez_compressed(str(filename), rank=np.array(self.rank, dtype=np.int32), indptr=indptr,
+                 indices=np.array([edge[0] for edge in edges], dtype=np.int32),
+                 costs=np.array([edge[1] for edge in edges], dtype=float),
+                 middles=np.array([edge[2] for edge in edges], dtype=np.int32),
+                 labels=np.array(self.network.labels, dtype=str), fingerprint=np.array(network_fingerprint(self.network)))
+
+    @classmethod
+    def load(cls, network, filename):
+        with np.load(str(filename)) as saved:
+            if str(saved['fingerprint']) != network_fingerprint(network) or saved['labels'].tolist() != list(network.labels):
+                raise Exception('Saved contraction hierarchy does not match the network.')
+            hierarchy = cls(network, build=False)
+            hierarchy.rank = saved['rank'].tolist()
+            indptr = saved['indptr'].tolist()
+            edges = list(zip(saved['indices'].tolist(), saved['costs'].tolist(), saved['middles'].tolist()))
+        hierarchy.up = [edges[first:last] for first, last in zip(indptr[:-1], indptr[1:])]
+        return hierarchy
+
+    def search(self, start, end):
+        # Returns (label path or None, iterations). Search state lives in dicts, so a query only touches the
+        # places it settles.
+        network, up = self.network, self.up
+        start, end = network.label_to_index(start), network.label_to_index(end)
+        distances, parents = ({start: 0}, {end: 0}), ({start: -1}, {end: -1})
+        heaps = ([(0, start)], [(0, end)])
+        mu, meeting, iterations = math.inf, -1, 0
+        while True:
+            # Grow the side with the smaller key; a side stops once its smallest key can't improve on the best meeting
+            forward_key = heaps[0][0][0] if heaps[0] else math.inf
+            backward_key = heaps[1][0][0] if heaps[1] else math.inf
+            if min(forward_key, backward_key) >= mu: break
+            side = 0 if forward_key <= backward_key else 1
+            distance, current = heapq.heappop(heaps[side])
+            side_distances, other_distances, side_parents, side_heap = distances[side], distances[1-side], parents[side], heaps[side]
+            if distance > side_distances[current]: continue
+            iterations += 1
+            if current in other_distances and distance + other_distances[current] < mu:
+                mu, meeting = distance + other_distances[current], current
+            # Stall-on-demand: a higher-ranked neighbour reached more cheaply means current isn't on a shortest path
+            edges, stalled = up[current], False
+            for neighbour, cost, _ in edges:
+                if neighbour in side_distances and side_distances[neighbour] + cost < distance:
+                    stalled = True
+                    break
+            if stalled: continue
+            for neighbour, cost, _ in edges:
+                neighbour_distance = distance + cost
+                if neighbour_distance < side_distances.get(neighbour, math.inf):
+                    side_distances[neighbour], side_parents[neighbour] = neighbour_distance, current
+                    heapq.heappush(side_heap, (neighbour_distance, neighbour))
+
+        if meeting == -1: return None, iterations
+        nodes, node = [], meeting
+        while node != -1:
+            nodes.append(node)
+            node = parents[0][node]
+        nodes, node = nodes[::-1], parents[1][meeting]
+        while node != -1:
+            nodes.append(node)
+            node = parents[1][node]
+
+        path = [nodes[0]]
+        for source, target in zip(nodes, nodes[1:]): path += self._unpack(source, target)
+        return [network.labels[node] for node in path], iterations
+
+    def _unpack(self, source, target):
+        # Original node IDs after source along the edge source-target, expanding shortcuts through their middles
+        path, stack = [], [(source, target)]
+        while stack:
+            source, target = stack.pop()
+            lower, higher = (source, target) if self.rank[source] < self.rank[target] else (target, source)
+            middle = next(middle for neighbour, _, middle in self.up[lower] if neighbour == higher)
+            if middle == -1: path.append(target)
+            else: stack += [(middle, target), (source, middle)]
+        return path
+
+
+def contraction_filename(graph_filename): return Path(str(graph_filename) + CONTRACTION_SUFFIX)
+
+
+def search_contraction_hierarchy(network):
+    # Returns (label path or None, iterations), contracting the network on first use
+    if network.contraction is None: network.contraction = ContractionHierarchy(network)
+    return network.contraction.search(network.start, network.end)
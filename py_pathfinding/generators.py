@@ -0,0 +1,124 @@
+import numpy as np
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+
+# Seeded generators of maze arrays (0 for a wall, 1 for an open cell) and networks, for benchmarks and tests. Network
+# generators return (labels, indptr, indices, costs) as taken by Network.set_adjacency, built directly from integer
+# edge arrays so they scale to millions of places.
+
+def random_walls_maze(height, width, wall_prob=0.3, seed=None):
+    return (np.random.default_rng(seed).random((height, width)) >= wall_prob).astype(float)
+
+
+def spiral_maze(height, width, seed=None):
+    # A one-cell-wide corridor spiralling inwards between one-cell-wide walls, like excel_mazes/spiral.xlsx
+    maze = np.zeros((height, width))
+    top, left, bottom, right = 0, 0, height-1, width-1
+    while top <= bottom and left <= right:
+        maze[top, left:right+1] = 1
+        if top + 1 > bottom: break
+        maze[top:bottom+1, right] = 1
+        if left > right - 1: break
+        maze[bottom, left:right+1] = 1
+        if top + 2 > bottom - 1: break
+        maze[top+2:bottom+1, left] = 1
+        if left + 2 > right - 2: break
+        maze[top+2, left:left+3] = 1
+        top, left, bottom, right = top+2, left+2, bottom-2, right-2
+    return maze
+
+
+def corridor_maze(height, width, spacing=4, gaps=2, seed=None):
+    # Horizontal corridors separated by walls every `spacing` rows, each wall with `gaps` random openings
+    rng = np.random.default_rng(seed)
+    maze = np.ones((height, width))
+    for row in range(spacing, height, spacing):
+        maze[row] = 0
+        maze[row, rng.choice(width, size=min(gaps, width), replace=False)] = 1
+    return maze
+
+
+def network_adjacency(n_nodes, sources, targets, costs):
+    # Symmetric CSR arrays from integer edge arrays, dropping self-loops and keeping the cheapest of duplicate edges.
+    # Places are labelled 'P0', 'P1', ...
+    sources, targets, costs = np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64), np.asarray(costs, dtype=float)
+    keep = sources != targets
+    low, high, costs = np.minimum(sources, targets)[keep], np.maximum(sources, targets)[keep], costs[keep]
+    order = np.lexsort((costs, high, low))
+    low, high, costs = low[order], high[order], costs[order]
+    first = np.ones(low.size, dtype=bool)
+    first[1:] = (low[1:] != low[:-1]) | (high[1:] != high[:-1])
+    low, high, costs = low[first], high[first], costs[first]
+
+    rows, cols = np.concatenate([low, high]), np.concatenate([high, low])
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_nodes), out=indptr[1:])
+    return ['P{}'.format(i) for i in range(n_nodes)], indptr, cols[order], np.concatenate([costs, costs])[order]
+
+
+def grid_network(n_nodes, seed=None):
+    # Road-grid-like lattice (about n_nodes places) with random edge costs in [1, 10)
+    rng = np.random.default_rng(seed)
+    side = max(2, int(round(np.sqrt(n_nodes))))
+    ids = np.arange(side*side).reshape(side, side)
+    sources = np.concatenate([ids[:, :-1].ravel(), ids[:-1, :].ravel()])
+    targets = np.concatenate([ids[:, 1:].ravel(), ids[1:, :].ravel()])
+    return network_adjacency(side*side, sources, targets, rng.uniform(1, 10, sources.size))
+
+
+def random_geometric_network(n_nodes, mean_degree=6, seed=None):
+    # Places scattered in the unit square, joined when closer than the radius giving mean_degree, with costs equal to
+    # the distance. Close pairs are found by bucketing places into cells one radius wide.
+    rng = np.random.default_rng(seed)
+    points = rng.random((n_nodes, 2))
+    radius = np.sqrt(mean_degree/(np.pi*n_nodes))
+    n_cells = max(1, int(1/radius))
+    cell_coords = np.minimum((points*n_cells).astype(np.int64), n_cells-1)
+    cells = cell_coords[:, 0]*n_cells + cell_coords[:, 1]
+    order = np.argsort(cells, kind='stable')
+    cell_starts = np.searchsorted(cells[order], np.arange(n_cells*n_cells + 1))
+
+    sources, targets = [], []
+    for d_row, d_col in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+        # Pair every place with every place in the neighbouring cell (each cell pair visited once)
+        rows, cols = cell_coords[:, 0] + d_row, cell_coords[:, 1] + d_col
+        valid = (rows < n_cells) & (cols >= 0) & (cols < n_cells)
+        places = np.flatnonzero(valid)
+        neighbour_cells = rows[valid]*n_cells + cols[valid]
+        counts = cell_starts[neighbour_cells+1] - cell_starts[neighbour_cells]
+        place_repeated = np.repeat(places, counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        neighbours = order[np.repeat(cell_starts[neighbour_cells], counts) + within]
+        pair = (place_repeated < neighbours) if (d_row, d_col) == (0, 0) else np.ones(place_repeated.size, dtype=bool)
+        sources.append(place_repeated[pair])
+        targets.append(neighbours[pair])
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    distances = np.linalg.norm(points[sources] - points[targets], axis=1)
+    close = distances < radius
+    return network_adjacency(n_nodes, sources[close], targets[close], distances[close])
+
+
+def scale_free_network(n_nodes, edges_per_node=2, seed=None):
+    # Barabasi-Albert preferential attachment: each new place joins edges_per_node existing places, chosen with
+    # probability proportional to their degree (by picking random endpoints of earlier edges). Costs in [1, 10).
+    rng = np.random.default_rng(seed)
+    m = max(1, min(edges_per_node, n_nodes-1))
+    n_edges = m*(n_nodes - m)
+    picks = rng.random(n_edges).tolist()
+    sources, targets, endpoints = [], [], []
+    for node in range(m, n_nodes):
+        for _ in range(m):
+            # The first place attaches to the seed places directly
+            edge = len(sources)
+            target = int(picks[edge]*m) if edge < m else endpoints[int(picks[edge]*2*edge)]
+            sources.append(node)
+            targets.append(target)
+            endpoints += [node, target]
+    return network_adjacency(n_nodes, sources, targets, rng.uniform(1, 10, n_edges))
+
+
+GRID_GENERATORS = {'random_walls': random_walls_maze, 'spiral': spiral_maze, 'corridors': corridor_maze}
+NETWORK_GENERATORS = {'random_geometric': random_geometric_network, 'grid_like': grid_network, 'scale_free': scale_free_network}
@@ -7,34 +7,117 @@ import logging
 from abc import ABC, abstractmethod
 
 import a_star
+import any_angle
+import contraction
+import generators
+import graph_files
+import grid_search
+import hierarchical
+import incremental
+import jump_point
+import landmarks
+import network_search
+import path_cache
+from search_result import SearchResult, CACHED, FOUND, UNREACHABLE, MAX_ITERATIONS
 from nicpy import nic_misc
 # nic_misc.logging_setup(Path.cwd(), date.today())
-# _logger = logging.getLogger('pathfinding_logger')
+_logger = logging.getLogger('pathfinding_logger')
 
 SQRT2 = np.sqrt(2)
 
 
+def build_adjacency(sources, targets, costs):
+    # Compile an undirected edge list into CSR arrays over integer node IDs: the neighbours of node i are
+    # indices[indptr[i]:indptr[i+1]], with matching entries in costs. Returns (labels, indptr, indices, costs),
+    # where labels maps node ID -> label.
+    sources, targets = np.asarray(sources, dtype=object), np.asarray(targets, dtype=object)
+    costs = np.asarray(costs, dtype=float)
+    rows, labels = pd.factorize(np.concatenate([sources, targets]))
+    cols = np.concatenate([rows[sources.size:], rows[:sources.size]])
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(len(labels) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(labels)), out=indptr[1:])
+    return list(labels), indptr, cols[order].astype(np.int64), np.concatenate([costs, costs])[order]
+
+
+def connected_components(n_nodes, sources, targets):
+    # Component ID (the smallest node ID in the component) for each node, by vectorised hooking and pointer jumping
+    # over the edge arrays
+    components = np.arange(n_nodes)
+    while True:
+        source_roots, target_roots = components[sources], components[targets]
+        if np.array_equal(source_roots, target_roots): return components
+        np.minimum.at(components, np.maximum(source_roots, target_roots), np.minimum(source_roots, target_roots))
+        while True:
+            jumped = components[components]
+            if np.array_equal(jumped, components): break
+            components = jumped
+
 
 # Abstract 'Node' class   ->     Place   /  Square      / Hex
 # Abstract 'Graph' class  ->     Network /  SquareGrid  / HexGrid
+# Hexagons (https://www.redblobgames.com/grids/hexagons/) are stored in a rectangular array in offset coordinates:
+# pointy-topped hexes shove odd rows half a hex right ("odd-r"), flat-topped hexes shove odd columns half a hex down
+# ("odd-q"). Distances and neighbours are worked out in axial coordinates (q, r).
+HEX_ORIENTATIONS = ('pointy', 'flat')
+HEX_AXIAL_DIRECTIONS = [(1, 0), (1, -1), (0, -1), (-1, 0), (-1, 1), (0, 1)]
+
+def hex_to_axial(label, orientation):
+    row, col = label
+    if orientation == 'pointy': return col - (row - (row & 1))//2, row
+    return col, row - (col - (col & 1))//2
+
+def axial_to_hex(q, r, orientation):
+    if orientation == 'pointy': return r, q + (r - (r & 1))//2
+    return r + (q - (q & 1))//2, q
+
+def hex_distance(label_a, label_b, orientation):
+    (q_a, r_a), (q_b, r_b) = hex_to_axial(label_a, orientation), hex_to_axial(label_b, orientation)
+    return (abs(q_a - q_b) + abs(r_a - r_b) + abs(q_a - q_b + r_a - r_b))//2
+
+def hex_neighbour_offsets(orientation):
+    # (d_row, d_col) of the six neighbours, for cells in even [0] and odd [1] rows (pointy) or columns (flat)
+    offsets = []
+    for parity in (0, 1):
+        label = (parity, 0) if orientation == 'pointy' else (0, parity)
+        q, r = hex_to_axial(label, orientation)
+        offsets.append([tuple(np.subtract(axial_to_hex(q + d_q, r + d_r, orientation), label).tolist())
+                        for d_q, d_r in HEX_AXIAL_DIRECTIONS])
+    return offsets
+
+
 class Node(ABC):
 
-    _neighbours_costs = {}
+    # Nodes are slotted, since big searches hold millions of them. Nodes built by the solvers (see trusted) skip label
+    # validation, refer to their parent by flat index (parent_index, -1 for none) rather than holding it, and load
+    # their neighbours' costs from the graph only when first asked for them.
+    __slots__ = ('label', 'index', 'parent', 'parent_index', 'accessible', 'g', 'h', 'f', '_neighbours_costs', '_graph')
 
     def __init__(self, label, neighbours_costs, parent=None, accessible=True):
         self.check_label(label)
         self.label = label
+        self.index, self._graph = None, None
 
         self.set_neighbours_costs(neighbours_costs)
 
         if (parent is not None) and (not isinstance(parent, type(self))): raise Exception('Parent node must be of the same type as the child node.')
         self.parent = parent
+        self.parent_index = -1 if parent is None or parent.index is None else parent.index
 
         if not isinstance(accessible, bool): raise Exception('\'accessible\' parameter must be a boolean.')
         self.accessible = accessible
 
         self.g, self.h, self.f = 0, 0, 0
 
+    @classmethod
+    def trusted(cls, label, graph, index, parent_index=-1, accessible=True):
+        # Fast construction for solvers, which only pass labels taken from the graph
+        node = cls.__new__(cls)
+        node.label, node.index, node.parent, node.parent_index, node.accessible = label, index, None, parent_index, accessible
+        node._neighbours_costs, node._graph = None, graph
+        node.g, node.h, node.f = 0, 0, 0
+        return node
+
     def __eq__(self, other): return self.label == other.label
 
     def __repr__(self): return 'Node {} - g={}, h={} f={}'.format(self.label, self.g, self.h, self.f)
@@ -45,10 +128,16 @@ class Node(ABC):
     # Defining greater than for purposes of heap queue
     def __gt__(self, other): return self.f > other.f
 
-    def set_neighbours_costs(self, neighbours_costs):
-        if not isinstance(neighbours_costs, dict): raise Exception('Neighbours must be specified as a dict of labels:costs.')
-        for neighbour in neighbours_costs.keys():
-            self.check_label(neighbour)
+    @property
+    def neighbours_costs(self):
+        if self._neighbours_costs is None: self._neighbours_costs = self._graph.find_neighbours(self.label)
+        return self._neighbours_costs
+
+    def set_neighbours_costs(self, neighbours_costs, trusted=False):
+        if not trusted:
+            if not isinstance(neighbours_costs, dict): raise Exception('Neighbours must be specified as a dict of labels:costs.')
+            for neighbour in neighbours_costs.keys():
+                self.check_label(neighbour)
         self._neighbours_costs = neighbours_costs
 
     @abstractmethod
@@ -62,16 +151,24 @@ class Node(ABC):
 
 class Place(Node):
 
+    __slots__ = ()
+
     def check_label(self, label):
         if not isinstance(label, str): raise Exception('PathListNode label must be a non-empty nonstring.')
         if label == '': raise Exception('PathListNode label must be a non-empty string.')
 
-    def get_cost_to_leave(self, neighbour): return self._neighbours_costs[neighbour.label] # / speed TODO: modified by agent speed
+    def get_cost_to_leave(self, neighbour): return self.neighbours_costs[neighbour.label] # / speed TODO: modified by agent speed
 
-    def get_heuristic_dist(self, other, heuristic_type): return 0
+    def get_heuristic_dist(self, other, heuristic_type):
+        if heuristic_type != 'alt': return 0
+        if self._graph is None or self._graph.landmarks is None:
+            raise Exception('The \'alt\' heuristic needs places from a Network with landmarks, see Network.build_landmarks.')
+        return self._graph.landmarks.lower_bound(self.index, other.index)
 
 class Square(Node):
 
+    __slots__ = ()
+
     def check_label(self, label):
         tuple_error_msg = 'Grid label (coordinates) must be a tuple of length 2.'
         if not isinstance(label, tuple): raise Exception(tuple_error_msg)
@@ -79,7 +176,7 @@ class Square(Node):
 
     def get_cost_to_leave(self, neighbour):
         distance = SQRT2 if neighbour.is_diagonal_neighbour(self) else 1
-        return self._neighbours_costs[neighbour.label] * distance # / speed TODO: modified by agent speed
+        return self.neighbours_costs[neighbour.label] * distance # / speed TODO: modified by agent speed
 
     def get_heuristic_dist(self, other, heuristic_type = 'euclidian'):
         return nic_misc.distance(heuristic_type, self.label, other.label)
@@ -87,13 +184,42 @@ class Square(Node):
     def is_diagonal_neighbour(self, other):
         return (self.label[0]-other.label[0], self.label[1]-other.label[1]) in SquareGrid.diagonal_coord_deltas
 
+class Hex(Node):
+
+    # Labels are the (row, col) offset coordinates of a HexGrid cell; every neighbour is one step away
+    __slots__ = ('orientation',)
+
+    def __init__(self, label, neighbours_costs, parent=None, accessible=True, orientation='pointy'):
+        if orientation not in HEX_ORIENTATIONS: raise Exception('Hex orientation must be one of {}.'.format(HEX_ORIENTATIONS))
+        self.orientation = orientation
+        super().__init__(label, neighbours_costs, parent, accessible)
+
+    def check_label(self, label):
+        tuple_error_msg = 'Hex label (offset coordinates) must be a tuple of length 2.'
+        if not isinstance(label, tuple): raise Exception(tuple_error_msg)
+        if len(label) != 2: raise Exception(tuple_error_msg)
+
+    def get_cost_to_leave(self, neighbour): return self.neighbours_costs[neighbour.label]
+
+    def get_heuristic_dist(self, other, heuristic_type='hex'):
+        return 0 if heuristic_type is None else hex_distance(self.label, other.label, self.orientation)
+
 
 class Graph(ABC):
 
     # nodes = {}      # dict with label:node
     start = None    # start node label
     end   = None    # end node label
+    ends  = ()      # end labels for solve_goals, see set_ends
     solution = []
+    goal_paths = {}     # end label: path from the last solve_goals, nearest first
+    result = None       # search_result.SearchResult of the last solve
+    graph_file = None   # binary graph file the graph was memory-mapped from, see load_binary
+    version = 0         # bumped whenever the geometry or costs change, invalidating anything derived from them
+    path_cache = None   # path_cache.PathCache, see enable_path_cache
+
+    # Methods that return optimal paths, whose results (and subpaths) are safe to serve from the path cache
+    cacheable_methods = ('a_star', 'grid_a_star', 'jps', 'dijkstra', 'd_star_lite', 'bidirectional', 'ch')
 
     @abstractmethod
     def load_graph(self, filename): pass
@@ -104,8 +230,9 @@ class Graph(ABC):
     @abstractmethod
     def is_accessible(self, label): pass
 
+    # With trusted=True, the label is assumed valid and parent is the parent's flat index (-1 for none)
     @abstractmethod
-    def create_node(self, label, parent=None): pass
+    def create_node(self, label, parent=None, trusted=False): pass
 
     @abstractmethod
     def solve(self, save_history=False): pass
@@ -122,72 +249,283 @@ class Graph(ABC):
     @abstractmethod
     def _check_label_setting(self): pass
 
+    @abstractmethod
+    def label_to_index(self, label): pass
+
+    @abstractmethod
+    def index_to_label(self, index): pass
+
+    # One-to-all search: returns (distances, predecessors) arrays for every node. With reverse=True the distances
+    # are costs *to* the label and each predecessor is the next step towards it (a flow field).
+    @abstractmethod
+    def distance_field(self, label, reverse=False): pass
+
+    def path_from_field(self, field, label, reverse=False):
+        distances, predecessors = np.ravel(field[0]), np.ravel(field[1])
+        index = self.label_to_index(label)
+        if not np.isfinite(distances[index]): return None
+        path = []
+        while index != -1:
+            path.append(self.index_to_label(index))
+            index = predecessors[index]
+        return path if reverse else path[::-1]
+
+    def set_ends(self, labels):
+        labels = list(dict.fromkeys(labels))
+        if not labels: raise Exception('No end labels specified.')
+        for label in labels:
+            if label != self.end: self._check_label_setting(label)
+        self.ends = tuple(labels)
+
+    def solve_goals(self, n_goals=1, max_iterations=10**6):
+        # One search for the paths from the start to the n_goals nearest of the ends (every end if n_goals is None).
+        # goal_paths holds the paths found, nearest first; solution and result describe the path to the nearest.
+        if not self.start: raise Exception('No start label specified.')
+        if not self.ends: raise Exception('No end labels specified, see set_ends.')
+        if self.start in self.ends: raise Exception('The start label is one of the end labels.')
+        if n_goals is not None and n_goals < 1: raise Exception('n_goals must be at least 1 (or None for every end).')
+        paths, iterations = self._search_goals(n_goals, max_iterations)
+        self.goal_paths = paths
+        path = next(iter(paths.values()), None)
+        status = MAX_ITERATIONS if iterations > max_iterations else FOUND if paths else UNREACHABLE
+        self.result = SearchResult(path, min(iterations, max_iterations), status, 'multi_goal', bound=1.0 if path else None)
+        self.solution = self.result.solution
+        # Every path reached is optimal, so can be served to later single-end solves
+        if self.path_cache is not None:
+            for end, path in paths.items(): self.path_cache.put(self._cache_key(end), path, self.version)
+        wanted = len(self.ends) if n_goals is None else min(n_goals, len(self.ends))
+        _logger.info('Reached {} of {} requested ends in {} iterations.'.format(len(paths), wanted, iterations))
+        return paths
+
+    def _search_goals(self, n_goals, max_iterations): raise Exception('solve_goals is not supported by this graph type.')
+
+    def loaded_from_file(self):
+        # The binary file the graph was loaded from, if it hasn't been changed since
+        return self.graph_file if self.graph_file is not None and self._graph_file_version == self.version else None
+
+    def enable_path_cache(self, max_entries=1024, max_labels=10**6):
+        self.path_cache = path_cache.PathCache(max_entries, max_labels)
+
+    def bump_version(self): self.version += 1
+
+    def _cache_key(self, end=None):
+        return (self.start, self.end if end is None else end, getattr(self, 'heuristic_type', None), getattr(self, '_diagonality', None))
+
+    def _cached_solution(self, method, save_history):
+        if self.path_cache is None or save_history or method not in self.cacheable_methods: return None
+        return self.path_cache.get(self._cache_key(), self.version)
+
+    def _check_solve_options(self, method, observer, weight, time_limit):
+        if observer and method != 'a_star': raise Exception('Search observers are only supported by the \'a_star\' method.')
+        if (weight is not None or time_limit is not None) and method not in ('a_star', 'ara_star'):
+            raise Exception('weight and time_limit are only supported by the \'a_star\' and \'ara_star\' methods.')
+
+    def _set_search_result(self, method, search, max_iterations=np.inf):
+        # From the (path or None, iterations) returned by the array engines (max_iterations left infinite for those
+        # without an iteration budget); paths found by the optimal methods get a bound of 1
+        self.result = SearchResult.from_search(*search, self.end, max_iterations, method)
+        if self.result.found and method in self.cacheable_methods: self.result.bound = 1.0
+        self.solution = self.result.solution
+
+    def _cache_solution(self, method):
+        # Only complete optimal paths are cached (not failures, the partial paths returned when a budget runs out or
+        # the suboptimal paths of weighted searches)
+        if self.path_cache is None or method not in self.cacheable_methods or isinstance(self.solution, int): return
+        if self.result.status != FOUND or self.result.bound != 1.0: return
+        if self.solution and self.solution[0] == self.start and self.solution[-1] == self.end:
+            self.path_cache.put(self._cache_key(), self.solution, self.version)
+
 class Network(Graph):
 
     start = ()
     end = ()
     network = []
+    label_ids = {}
+    contraction = None  # contraction.ContractionHierarchy, built on first use by the 'ch' method
+    landmarks = None    # landmarks.LandmarkTable, built on first use by the 'alt' heuristic_type
+    heuristic_type = None
 
-    def __init__(self, excel_network_filename):
+    def __init__(self, excel_network_filename=None, adjacency=None, graph_filename=None, heuristic_type=None):
 
-        if excel_network_filename:
+        # heuristic_type None searches blind (Dijkstra), 'alt' uses landmark lower bounds
+        if heuristic_type not in (None, 'alt'): raise Exception('A Network heuristic_type must be None or \'alt\'.')
+        self.heuristic_type = heuristic_type
+
+        if adjacency is not None:
+            self.set_adjacency(*adjacency)
+        elif graph_filename:
+            try: self.load_binary(graph_filename)
+            except: raise Exception('Failed to load network with filename {}.'.format(graph_filename))
+        elif excel_network_filename:
             try:
                 self.load_graph(excel_network_filename)
             except:
                 raise Exception('Failed to load maze with filename {}.'.format(excel_network_filename))
         else:
-            raise Exception('Must specify a file from which to load a network representation.')
-            # TODO: random network generator self.generate_random_network()
-        self.all_labels = set(self.network[0].to_list() + self.network[1].to_list())
+            raise Exception('Must specify a file or an adjacency from which to load a network representation.')
 
     def load_graph(self, filename):
         filepath = str(Path('excel_networks') / filename)
         self.network = pd.read_excel(filepath, header=None)
         invalid = self.check_network_invalid()
         if invalid:
-            _logger.error('Network invalid: {} node pairing has multiple specifications.'.format(invalid))
-            raise Exception()
+            for problem in invalid: _logger.error('Network invalid: {}'.format(problem))
+            raise Exception('Network invalid: {}'.format('; '.join(invalid)))
+        self.set_adjacency(*build_adjacency(self.network[0], self.network[1], self.network[2]))
+        self.check_network_components()
         _logger.info('Loaded network from {}.'.format(filename))
 
-    # TODO: what if two disjoint sections?
-    def check_network_invalid(self):
-        # Check that there are no duplicate entries (same pair of nodes)
-        for i in range(self.network.shape[0]-1):
-            row = self.network.iloc[i]
-            for j in range(i+1, self.network.shape[0]):
-                subsequent_row = self.network.iloc[j]
-                if (row[0]==subsequent_row[0] and row[1]==subsequent_row[1]) or (row[0]==subsequent_row[1] and row[1]==subsequent_row[0]):
-                    return [row[0], row[1]]
-        return []
+    def generate_random_network(self, n_places, generator='random_geometric', seed=None):
+        # generator is one of generators.NETWORK_GENERATORS
+        self.set_adjacency(*generators.NETWORK_GENERATORS[generator](n_places, seed=seed))
+
+    def load_binary(self, filename):
+        # Memory-map a network file written by save_binary (no validation: it was validated when first loaded)
+        self.set_adjacency(*graph_files.load_network(filename))
+        self.graph_file, self._graph_file_version = str(filename), self.version
+        # Pick up any landmark table or contraction hierarchy saved alongside it
+        if landmarks.landmarks_filename(filename).exists():
+            try: self.landmarks = landmarks.LandmarkTable.load(self, landmarks.landmarks_filename(filename))
+            except Exception as error: _logger.warning('Ignoring landmarks for {}: {}'.format(filename, error))
+        if contraction.contraction_filename(filename).exists():
+            try: self.contraction = contraction.ContractionHierarchy.load(self, contraction.contraction_filename(filename))
+            except Exception as error: _logger.warning('Ignoring contraction hierarchy for {}: {}'.format(filename, error))
+
+    def save_binary(self, filename):
+        graph_files.save_network(filename, self.labels, self.indptr, self.indices, self.costs)
+        if self.landmarks is not None: self.landmarks.save(landmarks.landmarks_filename(filename))
+        if self.contraction is not None: self.contraction.save(contraction.contraction_filename(filename))
+
+    def build_landmarks(self, n_landmarks=None, seed=None):
+        n_landmarks = landmarks.DEFAULT_LANDMARKS if n_landmarks is None else n_landmarks
+        self.landmarks = landmarks.LandmarkTable(self, n_landmarks, seed)
+
+    def set_adjacency(self, labels, indptr, indices, costs):
+        self.labels, self.indptr, self.indices, self.costs = labels, indptr, indices, costs
+        self.label_ids = {label: i for i, label in enumerate(labels)}
+        self.all_labels = self.label_ids.keys()
+        self.contraction, self.landmarks = None, None
+        self.bump_version()
+
+    def set_edge_cost(self, label_a, label_b, cost):
+        # Change the cost of an existing edge (in both directions)
+        if cost < 0: raise Exception('Cannot have a negative cost: {} for ({}, {}).'.format(cost, label_a, label_b))
+        for source, target in ((label_a, label_b), (label_b, label_a)):
+            if source not in self.label_ids or target not in self.label_ids: raise Exception('Label not in network.')
+            first, last = self.indptr[self.label_ids[source]], self.indptr[self.label_ids[source]+1]
+            position = np.flatnonzero(self.indices[first:last] == self.label_ids[target])
+            if position.size == 0: raise Exception('No edge between {} and {}.'.format(label_a, label_b))
+            self.costs[first + position[0]] = cost
+        self.contraction, self.landmarks = None, None
+        self.bump_version()
+
+    def label_to_index(self, label): return self.label_ids[label]
+
+    def index_to_label(self, index): return self.labels[index]
+
+    def distance_field(self, label, reverse=False):
+        # Edges are symmetric, so the reverse field is the same as the forward one
+        if self._check_field_label(label): return network_search.network_distance_field(self, self.label_to_index(label))
+
+    def _check_field_label(self, label):
+        if label not in self.label_ids: raise Exception('Label {} not in network.'.format(label))
+        return True
 
-        # TODO: check types
+    def check_network_invalid(self):
+        # Returns a list describing every problem found (empty if the network is valid)
+        if self.network.shape[1] < 3: return ['Network must have (label, label, cost) columns.']
+        sources, targets = self.network[0].to_numpy(dtype=object), self.network[1].to_numpy(dtype=object)
+        costs = pd.to_numeric(self.network[2], errors='coerce').to_numpy(dtype=float)
+        problems = []
+
+        # Check types: labels must be non-empty strings and costs finite, non-negative numbers
+        is_label = np.vectorize(lambda label: isinstance(label, str) and label != '', otypes=[bool])
+        valid_labels = is_label(sources) & is_label(targets)
+        for i in np.flatnonzero(~valid_labels):
+            problems.append('Row {}: labels must be non-empty strings, got ({}, {}).'.format(i, sources[i], targets[i]))
+        for i in np.flatnonzero(valid_labels & ~np.isfinite(costs)):
+            problems.append('Row {}: cost {} for ({}, {}) is not a number.'.format(i, self.network[2].iloc[i], sources[i], targets[i]))
+        for i in np.flatnonzero(valid_labels & (costs < 0)):
+            problems.append('Cannot have a negative cost: {} for ({}, {}).'.format(costs[i], sources[i], targets[i]))
+        for i in np.flatnonzero(valid_labels & (sources == targets)):
+            problems.append('Row {}: ({}, {}) connects a place to itself.'.format(i, sources[i], targets[i]))
+
+        # Check that there are no duplicate entries (same unordered pair of nodes), via sorted-pair hashing
+        rows = np.flatnonzero(valid_labels)
+        pairs = pd.DataFrame({'low': np.where(sources[rows] <= targets[rows], sources[rows], targets[rows]),
+                              'high': np.where(sources[rows] <= targets[rows], targets[rows], sources[rows]),
+                              'row': rows})
+        duplicates = pairs[pairs.duplicated(['low', 'high'], keep=False)]
+        for (low, high), group in duplicates.groupby(['low', 'high'], sort=False):
+            problems.append('({}, {}) node pairing has multiple specifications (rows {}).'.format(low, high, group['row'].tolist()))
+
+        return problems
+
+    def find_components(self):
+        return connected_components(len(self.labels), np.repeat(np.arange(len(self.labels)), np.diff(self.indptr)), self.indices)
+
+    def check_network_components(self):
+        self.components = self.find_components()
+        roots, sizes = np.unique(self.components, return_counts=True)
+        if roots.size > 1:
+            _logger.warning('Network has {} disjoint components: {}.'.format(
+                roots.size, '; '.join('{} places including {}'.format(size, self.labels[root]) for root, size in zip(roots, sizes))))
+        return roots.size
 
     def find_neighbours(self, label):
-        if label not in self.all_labels: raise Exception('Label not in network.')
-        neighbours_costs = {}
-        neighbour_rows1 = self.network[self.network[0] == label]
-        for i, row in neighbour_rows1.iterrows():
-            if row[1] in neighbours_costs.keys(): raise Exception('Invalid network detected: multiple connections from {} to {}.'.format(label, row[1]))
-            neighbours_costs[row[1]] = row[2]
-        neighbour_rows2 = self.network[self.network[1] == label]
-        for i, row in neighbour_rows2.iterrows():
-            if row[0] in neighbours_costs.keys(): raise Exception('Invalid network detected: multiple connections from {} to {}.'.format(label, row[0]))
-            neighbours_costs[row[0]] = row[2]
-        return neighbours_costs
+        node_id = self.label_ids.get(label)
+        if node_id is None: raise Exception('Label not in network.')
+        first, last = self.indptr[node_id], self.indptr[node_id+1]
+        labels = self.labels
+        return {labels[j]: cost for j, cost in zip(self.indices[first:last].tolist(), self.costs[first:last].tolist())}
 
     def is_accessible(self, label): return True
 
-    def create_node(self, label, parent=None):
+    def path_cost(self, path): return sum(self.find_neighbours(label)[next_label] for label, next_label in zip(path, path[1:]))
+
+    def create_node(self, label, parent=None, trusted=False):
+        if trusted: return Place.trusted(label, self, self.label_ids[label], parent)
         return Place(label, self.find_neighbours(label), parent=parent, accessible=self.is_accessible(label))
 
-    def solve(self, save_history=False):
+    def solve(self, save_history=False, method='a_star', observer=None, weight=None, max_iterations=10**6, time_limit=None):
+        # weight: heuristic weight of 'a_star' (weighted A*, default 1) or the initial weight of 'ara_star'. Solvers give
+        # up after max_iterations expansions, and 'a_star'/'ara_star' also after time_limit seconds.
         if self.check_graph():
-            self.solution = a_star.run_a_star(self, heuristic_type=None, save_history=save_history)
+            self._check_solve_options(method, observer, weight, time_limit)
+            self.solution, self.result = self._cached_solution(method, save_history), None
+            if self.solution is not None: self.result = SearchResult(self.solution, 0, CACHED, method, bound=1.0)
+            elif method == 'a_star':
+                if self.heuristic_type == 'alt' and self.landmarks is None: self.build_landmarks()
+                self.result = a_star.run_a_star(self, self.heuristic_type, save_history=save_history, max_iterations=max_iterations,
+                                                observer=observer, weight=1.0 if weight is None else weight, time_limit=time_limit)
+                self.solution = self.result.solution
+            elif method == 'ara_star':
+                if save_history: raise Exception('save_history is not supported by the \'ara_star\' method.')
+                if self.heuristic_type == 'alt' and self.landmarks is None: self.build_landmarks()
+                self.result = a_star.run_anytime_a_star(self, self.heuristic_type, a_star.ARA_INITIAL_WEIGHT if weight is None else weight,
+                                                        max_iterations=max_iterations, time_limit=time_limit)
+                self.solution = self.result.solution
+            elif method == 'dijkstra':
+                if save_history: raise Exception('save_history is only supported by the \'a_star\' method.')
+                self._set_search_result(method, network_search.search_network(self, max_iterations), max_iterations)
+            elif method == 'bidirectional':
+                if save_history: raise Exception('save_history is not supported by the \'bidirectional\' method.')
+                self._set_search_result(method, network_search.search_network_bidirectional(self, max_iterations), max_iterations)
+            elif method == 'ch':
+                if save_history: raise Exception('save_history is not supported by the \'ch\' method.')
+                self._set_search_result(method, contraction.search_contraction_hierarchy(self))
+            else:
+                raise Exception('Unknown solve method \'{}\' for a Network.'.format(method))
+            self._cache_solution(method)
             if isinstance(self.solution, int):
                 _logger.info('Unable to solve the network after {} iterations.'.format(self.solution))
             else:
                 _logger.info('Successfully solved the Network with {} steps.'.format(len(self.solution)-1))
 
+    def _search_goals(self, n_goals, max_iterations):
+        if not self.label_ids: raise Exception('No network specified.')
+        return network_search.search_network_goals(self, self.ends, n_goals, max_iterations)
+
     def set_start(self, label):
         if self._check_label_setting(label): self.start = label
 
@@ -195,8 +533,8 @@ class Network(Graph):
         if self._check_label_setting(label): self.end = label
 
     def check_graph(self):
-        if not isinstance(self.network, pd.DataFrame): raise Exception('No network specified.')
-        if self.network.empty: raise Exception('The specified network is empty.')
+        if not self.label_ids: raise Exception('No network specified.')
+        if self.indices.size == 0: raise Exception('The specified network is empty.')
         if not self.start and not self.end: raise Exception('No start or end labels specified.')
         if not self.start: raise Exception('No start label specified.')
         if not self.end: raise Exception('No end label specified.')
@@ -208,7 +546,7 @@ class Network(Graph):
         if label == '': raise Exception('PathListNode label must be a non-empty string.')
         if not self.is_accessible(label) or label in [self.start, self.end]:
             raise Exception('Cannot place a start or end on an inaccessible node or an existing start or end.')
-        if label not in self.network[0].to_list() and label not in self.network[1].to_list():
+        if label not in self.label_ids:
             raise Exception('Label {} not in network.'.format(label))
         return True
 
@@ -217,43 +555,97 @@ class SquareGrid(Graph):
     start = ()
     end = ()
     dimensions = ()
-    maze_array = np.array([])
+    _maze_array = np.array([])
     maze_array_solved = np.array([])
+    hierarchy = None    # hierarchical.ClusterAbstraction, built on first use by the 'hpa' method
+    planner = None      # incremental.DStarLite, kept between solves by the 'd_star_lite' method
+    sight_lines = None  # any_angle.LineOfSight, kept between solves by the Theta* methods
 
     # Adjacent squares to search
     straight_coords_deltas = [(-1, 0), (0, -1), (0, 1), (1, 0)]
     diagonal_coord_deltas = [(-1, -1), (1, 1), (-1, 1), (1, -1)]
 
-    def __init__(self, heuristic_type, excel_maze_filename=None, diagonality=False):
+    def __init__(self, heuristic_type, excel_maze_filename=None, diagonality=False, maze_array=None, graph_filename=None):
 
         self.heuristic_type = heuristic_type
 
         if not isinstance(diagonality, bool): raise Exception('\'diagonality\' parameter must be a boolean.')
         self._diagonality = diagonality
 
-        if excel_maze_filename:
+        if maze_array is not None: self.set_maze_array(maze_array)
+        elif graph_filename:
+            try: self.load_binary(graph_filename)
+            except: raise Exception('Failed to load maze with filename {}'.format(graph_filename))
+        elif excel_maze_filename:
             try: self.load_graph(excel_maze_filename)
             except: raise Exception('Failed to load maze with filename {}'.format(excel_maze_filename))
         else: self.generate_random_maze(10, 10, 0.5)
 
     def load_graph(self, filename):
         filepath = str(Path('excel_mazes')/filename)
-        self.maze_array = np.asarray(pd.read_excel(filepath, header=None))
-        self.dimensions = self.maze_array.shape
+        self.set_maze_array(np.asarray(pd.read_excel(filepath, header=None)))
         # TODO: detect blanks and make them walls (0)
         # _logger.info('Loaded maze from {}.'.format(filename))
 
-    def generate_random_maze(self, size_y, size_x, wall_prob):
-        random_array = np.random.rand(size_y, size_x)
-        rounder = np.vectorize(lambda t: 1 if t > 1 - wall_prob else 0)
-        self.maze_array = rounder(random_array)
-        self.dimensions = self.maze_array.shape
+    def load_binary(self, filename):
+        # Memory-map a grid file written by save_binary
+        self.set_maze_array(graph_files.load_grid(filename), copy_array=False)
+        self.graph_file, self._graph_file_version = str(filename), self.version
+
+    def save_binary(self, filename):
+        graph_files.save_grid(filename, self.maze_array)
+
+    def generate_random_maze(self, size_y, size_x, wall_prob, seed=None):
+        random_array = np.random.rand(size_y, size_x) if seed is None else np.random.default_rng(seed).random((size_y, size_x))
+        self.set_maze_array((random_array > 1 - wall_prob).astype(int))
         # _logger.info('No .xlsx maze file specified - generating a random 10x10 maze with wall_prob=0.5.')
 
+    # maze_array is held as a read-only copy, so every change goes through set_maze_array (assignment) or update_cells
+    # and moves the version on: writing to it in place raises, and edits to the array it was set from don't reach it
+    @property
+    def maze_array(self): return self._maze_array
+
+    @maze_array.setter
+    def maze_array(self, maze_array): self.set_maze_array(maze_array)
+
+    def set_maze_array(self, maze_array, copy_array=True):
+        # copy_array=False is only for the copy-on-write memory maps of load_binary, which nothing else can write through
+        self._maze_array = np.array(maze_array) if copy_array else np.asarray(maze_array).view()
+        self._maze_array.flags.writeable = False
+        self.dimensions = self._maze_array.shape
+        self.hierarchy, self.planner, self.sight_lines = None, None, None
+        self.bump_version()
+
+    def update_cells(self, changes):
+        # Set the cost of each cell in a {label: cost} dict (0 for a wall). maze_array can only be edited through here
+        # (or replaced), so the version moves on and the cluster abstraction is patched instead of rebuilt.
+        for label, cost in changes.items():
+            if not self.check_label_on_grid(label): raise Exception('Label {} is not on the grid (dimensions {}).'.format(label, self.dimensions))
+            if cost < 0: raise Exception('Cannot have a negative cost: {} at {}.'.format(cost, label))
+        # Arrays over read-only memory are copied on their first edit
+        try: self._maze_array.flags.writeable = True
+        except ValueError: self._maze_array = self._maze_array.copy()
+        try:
+            for label, cost in changes.items(): self._maze_array[label] = cost
+        finally: self._maze_array.flags.writeable = False
+        if self.hierarchy is not None: self.hierarchy.update_cells(list(changes))
+        self.bump_version()
+
     def is_accessible(self, label):
         return False if self.maze_array[label] == 0 else True
 
-    def create_node(self, label, parent):
+    def path_cost(self, path):
+        # Each step costs the cell left times the distance moved
+        return sum(self.maze_array[label]*(SQRT2 if label[0] != next_label[0] and label[1] != next_label[1] else 1)
+                   for label, next_label in zip(path, path[1:]))
+
+    def line_path_cost(self, path):
+        # Cost of an any-angle (waypoint) path, each leg costing the cells it crosses times the length inside them
+        sight = any_angle.line_of_sight(self)
+        return sum(sight.cost(self.label_to_index(label), self.label_to_index(next_label)) for label, next_label in zip(path, path[1:]))
+
+    def create_node(self, label, parent=None, trusted=False):
+        if trusted: return Square.trusted(label, self, label[0]*self.dimensions[1] + label[1], parent, self.is_accessible(label))
         return Square(label, self.find_neighbours(label), parent=parent, accessible=self.is_accessible(label))
 
     def set_start(self, label):
@@ -278,9 +670,62 @@ class SquareGrid(Graph):
         if self.maze_array[label] == 0: return False
         return True
 
-    def solve(self, save_history=False):
+    def label_to_index(self, label): return label[0]*self.dimensions[1] + label[1]
+
+    def index_to_label(self, index): return divmod(int(index), self.dimensions[1])
+
+    def distance_field(self, label, reverse=False):
+        if self._check_field_label(label): return grid_search.grid_distance_field(self, label, reverse)
+
+    def grid_steps(self):
+        # (d_row, d_col, distance, cells) for each move, as used by the grid_search solvers: cells is None when the
+        # move can be made from any cell, else a (height, width) boolean mask of the cells it is made from
+        deltas = self.straight_coords_deltas + (self.diagonal_coord_deltas if self._diagonality else [])
+        return [(d_row, d_col, SQRT2 if d_row and d_col else 1.0, None) for d_row, d_col in deltas]
+
+    def _check_field_label(self, label):
+        if self.maze_array.size == 0: raise Exception('No maze geometry specified.')
+        if not self.check_label_on_grid(label): raise Exception('Label {} is not on the grid (dimensions {}).'.format(label, self.dimensions))
+        if not self.is_accessible(label): raise Exception('Cannot compute a distance field from a wall.')
+        return True
+
+    def solve(self, save_history=False, method='a_star', observer=None, weight=None, max_iterations=10**6, time_limit=None):
+        # weight: heuristic weight of 'a_star' (weighted A*, default 1) or the initial weight of 'ara_star'. Solvers give
+        # up after max_iterations expansions, and 'a_star'/'ara_star' also after time_limit seconds.
         if self.check_graph():
-            self.solution = a_star.run_a_star(self, self.heuristic_type, save_history)
+            self._check_solve_options(method, observer, weight, time_limit)
+            self.solution, self.result = self._cached_solution(method, save_history), None
+            if self.solution is not None: self.result = SearchResult(self.solution, 0, CACHED, method, bound=1.0)
+            elif method == 'a_star':
+                self.result = a_star.run_a_star(self, self.heuristic_type, save_history, max_iterations, observer,
+                                                1.0 if weight is None else weight, time_limit)
+                self.solution = self.result.solution
+            elif method == 'ara_star':
+                if save_history: raise Exception('save_history is not supported by the \'ara_star\' method.')
+                self.result = a_star.run_anytime_a_star(self, self.heuristic_type, a_star.ARA_INITIAL_WEIGHT if weight is None else weight,
+                                                        max_iterations=max_iterations, time_limit=time_limit)
+                self.solution = self.result.solution
+            elif method == 'grid_a_star':
+                self._set_search_result(method, grid_search.search_grid_a_star(self, self.heuristic_type, save_history, max_iterations), max_iterations)
+            elif method == 'jps':
+                if save_history: raise Exception('save_history is not supported by the \'jps\' method.')
+                self._set_search_result(method, jump_point.search_jump_points(self, self.heuristic_type, max_iterations), max_iterations)
+            elif method == 'hpa':
+                if save_history: raise Exception('save_history is not supported by the \'hpa\' method.')
+                self._set_search_result(method, hierarchical.search_hierarchical(self))
+            elif method == 'd_star_lite':
+                if save_history: raise Exception('save_history is not supported by the \'d_star_lite\' method.')
+                self._set_search_result(method, incremental.search_d_star_lite(self, max_iterations), max_iterations)
+            elif method == 'bidirectional':
+                if save_history: raise Exception('save_history is not supported by the \'bidirectional\' method.')
+                self._set_search_result(method, grid_search.search_grid_bidirectional(self, self.heuristic_type, max_iterations), max_iterations)
+            elif method in ('theta_star', 'lazy_theta_star'):
+                # Any-angle paths, returned as waypoints (see line_path_cost)
+                if save_history: raise Exception('save_history is not supported by the \'{}\' method.'.format(method))
+                self._set_search_result(method, any_angle.search_theta_star(self, method == 'lazy_theta_star', max_iterations), max_iterations)
+            else:
+                raise Exception('Unknown solve method \'{}\' for a SquareGrid.'.format(method))
+            self._cache_solution(method)
             if isinstance(self.solution, int):
                 a=2
                 # _logger.info('Unable to solve the network after {} iterations.'.format(self.solution))
@@ -289,6 +734,14 @@ class SquareGrid(Graph):
                 for i, step in enumerate(self.solution[1:-1]): self.maze_array_solved[step] = -i-1
                 # _logger.info('Successfully solved the GridMaze with {} steps.'.format(len(self.solution)-1))
 
+    def _search_goals(self, n_goals, max_iterations):
+        if self.maze_array.size == 0: raise Exception('No maze geometry specified.')
+        paths, iterations = grid_search.search_grid_goals(self, self.ends, self.heuristic_type, n_goals, max_iterations)
+        if paths:
+            self.maze_array_solved = copy(self.maze_array)
+            for i, step in enumerate(next(iter(paths.values()))[1:-1]): self.maze_array_solved[step] = -i-1
+        return paths, iterations
+
     def find_neighbours(self, label):
         neighbour_labels = [(label[0] + d[0], label[1] + d[1]) for d in self.straight_coords_deltas
                             if self.check_label_on_grid((label[0] + d[0], label[1] + d[1])) and self.check_label_accessible(label)]
@@ -307,48 +760,68 @@ class SquareGrid(Graph):
         return True
 
 
-# TODO: Hexagons
-# https://www.redblobgames.com/grids/hexagons/
-
-# class Hex(Node):
-#
-#     hex_type = '' # flat or pointy
-#
-#     def check_label(self, label):
-#
-#     def get_cost_to_leave(self, neighbour):
-#
-#     def get_heuristic_dist(self, other, heuristic_type):
-#
-#
-# class HexGrid(Graph):
-#
-#     def load_graph(self, filename):
-#
-#
-#     def find_neighbours(self, label):
-#
-#
-#     def is_accessible(self, label):
-#
-#
-#     def create_node(self, label, parent=None):
-#
-#
-#     def solve(self, save_history=False):
-#
-#
-#     def set_start(self, label):
-#
-#
-#     def set_end(self, label):
-#
-#
-#     def check_graph(self):
-#
-#
-#     def _check_label_setting(self):
+class HexGrid(SquareGrid):
+
+    # Hex map on a dense maze_array in offset coordinates (see hex_to_axial), sharing SquareGrid's array storage, label
+    # handling and file formats. Moving to any of the six neighbours costs the cell left. Supports the 'a_star',
+    # 'ara_star', 'grid_a_star' and 'bidirectional' solve methods, with heuristic_type 'hex' (hex distance) or None.
+    solve_methods = ('a_star', 'ara_star', 'grid_a_star', 'bidirectional')
+
+    def __init__(self, heuristic_type='hex', excel_maze_filename=None, orientation='pointy', maze_array=None, graph_filename=None):
+        if heuristic_type not in ('hex', None): raise Exception('A HexGrid heuristic_type must be \'hex\' or None.')
+        if orientation not in HEX_ORIENTATIONS: raise Exception('Hex orientation must be one of {}.'.format(HEX_ORIENTATIONS))
+        self.orientation = orientation
+        # Neighbour offsets depend on the parity of the row (pointy) or column (flat) of the cell
+        self.parity_axis = 0 if orientation == 'pointy' else 1
+        self.neighbour_offsets = hex_neighbour_offsets(orientation)
+        super().__init__(heuristic_type, excel_maze_filename, False, maze_array, graph_filename)
+
+    def find_neighbours(self, label):
+        offsets = self.neighbour_offsets[label[self.parity_axis] % 2]
+        neighbour_labels = [(label[0] + d_row, label[1] + d_col) for d_row, d_col in offsets
+                            if self.check_label_on_grid((label[0] + d_row, label[1] + d_col))]
+        return {neighbour_label: self.maze_array[label] for neighbour_label in neighbour_labels}
 
+    def path_cost(self, path): return sum(self.maze_array[label] for label in path[:-1])
+
+    def create_node(self, label, parent=None, trusted=False):
+        if trusted: node = Hex.trusted(label, self, label[0]*self.dimensions[1] + label[1], parent, self.is_accessible(label))
+        else: return Hex(label, self.find_neighbours(label), parent=parent, accessible=self.is_accessible(label), orientation=self.orientation)
+        node.orientation = self.orientation
+        return node
+
+    def hex_distances(self, label):
+        # Hex distance from label to every cell, shaped like maze_array
+        rows, cols = np.indices(self.dimensions)
+        q, r = hex_to_axial((rows, cols), self.orientation)
+        q_label, r_label = hex_to_axial(label, self.orientation)
+        return (np.abs(q - q_label) + np.abs(r - r_label) + np.abs(q - q_label + r - r_label))//2
+
+    def grid_steps(self):
+        parities = np.indices(self.dimensions)[self.parity_axis] % 2
+        return [(d_row, d_col, 1.0, parities == parity) for parity in (0, 1) for d_row, d_col in self.neighbour_offsets[parity]]
+
+    def solve(self, save_history=False, method='a_star', observer=None, weight=None, max_iterations=10**6, time_limit=None):
+        if method not in self.solve_methods: raise Exception('Unknown solve method \'{}\' for a HexGrid.'.format(method))
+        super().solve(save_history, method, observer, weight, max_iterations, time_limit)
+
+
+# Converters from the Excel mazes/networks to the binary graph format
+def convert_excel_maze(excel_filename, filename):
+    SquareGrid(None, excel_maze_filename=excel_filename).save_binary(filename)
+
+def convert_excel_network(excel_filename, filename):
+    Network(excel_filename).save_binary(filename)
+
+def convert_excel_directories(output_directory):
+    # Converts every file in excel_mazes/ and excel_networks/ to <name>.grid / <name>.network in output_directory
+    output_directory = Path(output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+    for excel_file in sorted(Path('excel_mazes').glob('*.xlsx')):
+        convert_excel_maze(excel_file.name, output_directory/(excel_file.stem + graph_files.GRID_SUFFIX))
+    for excel_file in sorted(Path('excel_networks').glob('*.xlsx')):
+        try: convert_excel_network(excel_file.name, output_directory/(excel_file.stem + graph_files.NETWORK_SUFFIX))
+        except Exception as error: _logger.error('Skipping {}: {}'.format(excel_file.name, error))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,64 @@
+import numpy as np
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+
+# Native binary graph files, opened with np.memmap so large graphs load instantly and worker processes share their
+# pages. A grid file is a header followed by the raw maze_array; a network file is a header followed by the CSR arrays
+# (indptr, indices, costs) and a label table of UTF-8 byte offsets and bytes. Arrays are mapped copy-on-write, so
+# edits (e.g. SquareGrid.update_cells) stay private to the process and never reach the file.
+
+GRID_MAGIC, NETWORK_MAGIC = b'PFGRID01', b'PFNETW01'
+GRID_HEADER_DTYPE = np.dtype([('magic', 'S8'), ('dtype', 'S8'), ('height', '<i8'), ('width', '<i8')])
+NETWORK_HEADER_DTYPE = np.dtype([('magic', 'S8'), ('n_nodes', '<i8'), ('n_entries', '<i8'), ('label_bytes', '<i8')])
+GRID_SUFFIX, NETWORK_SUFFIX = '.grid', '.network'
+
+
+def _read_header(filename, header_dtype, magic):
+    header = np.fromfile(str(filename), dtype=header_dtype, count=1)
+    if header.size == 0 or header['magic'][0] != magic:
+        raise Exception('{} is not a {} file.'.format(filename, 'grid' if magic == GRID_MAGIC else 'network'))
+    return header[0]
+
+
+def save_grid(filename, maze_array):
+    maze_array = np.ascontiguousarray(maze_array)
+    if maze_array.ndim != 2: raise Exception('A grid must be a 2D array.')
+    if maze_array.dtype.kind not in 'biuf': raise Exception('A grid must hold numeric cell costs.')
+    dtype = maze_array.dtype.newbyteorder('<')
+    with open(str(filename), 'wb') as file:
+        np.array([(GRID_MAGIC, dtype.str.encode(), *maze_array.shape)], dtype=GRID_HEADER_DTYPE).tofile(file)
+        maze_array.astype(dtype, copy=False).tofile(file)
+
+
+def load_grid(filename):
+    header = _read_header(filename, GRID_HEADER_DTYPE, GRID_MAGIC)
+    return np.memmap(str(filename), dtype=np.dtype(header['dtype'].decode()), mode='c', offset=GRID_HEADER_DTYPE.itemsize,
+                     shape=(int(header['height']), int(header['width'])))
+
+
+def save_network(filename, labels, indptr, indices, costs):
+    encoded = [str(label).encode('utf-8') for label in labels]
+    label_offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+    np.cumsum([len(label) for label in encoded], out=label_offsets[1:])
+    with open(str(filename), 'wb') as file:
+        np.array([(NETWORK_MAGIC, len(labels), len(indices), label_offsets[-1])], dtype=NETWORK_HEADER_DTYPE).tofile(file)
+        for array, dtype in ((indptr, '<i8'), (indices, '<i8'), (costs, '<f8'), (label_offsets, '<i8')):
+            np.asarray(array, dtype=dtype).tofile(file)
+        file.write(b''.join(encoded))
+
+
+def load_network(filename):
+    # Returns (labels, indptr, indices, costs), as taken by Network.set_adjacency
+    header = _read_header(filename, NETWORK_HEADER_DTYPE, NETWORK_MAGIC)
+    n_nodes, n_entries = int(header['n_nodes']), int(header['n_entries'])
+    sections, offset = [], NETWORK_HEADER_DTYPE.itemsize
+    for dtype, count in (('<i8', n_nodes+1), ('<i8', n_entries), ('<f8', n_entries), ('<i8', n_nodes+1), ('u1', int(header['label_bytes']))):
+        sections.append(np.memmap(str(filename), dtype=dtype, mode='c', offset=offset, shape=(count,)) if count else np.zeros(0, dtype=dtype))
+        offset += count*np.dtype(dtype).itemsize
+    indptr, indices, costs, label_offsets, label_bytes = sections
+    # Labels are decoded up front, since Network looks them up by value
+    raw, label_offsets = label_bytes.tobytes(), label_offsets.tolist()
+    labels = [raw[first:last].decode('utf-8') for first, last in zip(label_offsets[:-1], label_offsets[1:])]
+    return labels, indptr, indices, costs
@@ -0,0 +1,272 @@
+import heapq
+import numpy as np
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+from nicpy import nic_misc
+from history import HistoryRecorder, new_history_directory, EXPANDED, PUSHED
+from bidirectional import search_bidirectional, average_potential
+from multi_goal import search_goals
+
+
+# Grid-specialised solvers working directly on a SquareGrid's (or HexGrid's) maze_array. Cells are addressed by flat index
+# row*width+col, and g-scores, parents and closed flags live in flat arrays, so no Square objects are created.
+
+SQRT2 = np.sqrt(2)
+GOAL_CHUNK_ENTRIES = 2**22    # (cell, goal) distances worked out at once by goal_heuristic
+
+
+def grid_deltas(grid):
+    return grid.straight_coords_deltas + (grid.diagonal_coord_deltas if grid._diagonality else [])
+
+
+def flat_costs(grid):
+    return np.asarray(grid.maze_array, dtype=float).ravel()
+
+
+def heuristic_array(dimensions, target, heuristic_type):
+    rows, cols = np.indices(dimensions)
+    d_row, d_col = rows - target[0], cols - target[1]
+    if heuristic_type == 'euclidian': return np.sqrt(d_row**2 + d_col**2).ravel()
+    if heuristic_type == 'manhattan': return (np.abs(d_row) + np.abs(d_col)).ravel()
+    if heuristic_type is None: return np.zeros(d_row.size)
+    # Fall back on the generic (slow) distance for any other heuristic
+    return np.array([nic_misc.distance(heuristic_type, (r, c), target)
+                     for r, c in zip(rows.ravel().tolist(), cols.ravel().tolist())])
+
+
+def grid_heuristic(grid, target, heuristic_type):
+    # Hex grids measure their own (hex) distances
+    if heuristic_type == 'hex': return grid.hex_distances(target).ravel().astype(float)
+    return heuristic_array(grid.dimensions, target, heuristic_type)
+
+
+def goal_heuristic(grid, goals, heuristic_type, cells=None):
+    # Heuristic distance from each of cells (flat indices, every cell by default) to the nearest of goals, and which of
+    # goals that is. Distances are computed for blocks of goals at once.
+    goals = np.asarray(list(goals), dtype=np.int64).reshape(-1, 2)
+    cells = np.arange(grid.dimensions[0]*grid.dimensions[1]) if cells is None else cells
+    h, nearest = np.full(cells.size, np.inf), np.zeros(cells.size, dtype=np.int64)
+    if heuristic_type not in ('euclidian', 'manhattan'):
+        for i, goal in enumerate(goals.tolist()):
+            distances = grid_heuristic(grid, tuple(goal), heuristic_type)[cells]
+            closer = distances < h
+            h[closer], nearest[closer] = distances[closer], i
+        return h, nearest
+    rows, cols = np.divmod(cells, grid.dimensions[1])
+    block = max(1, GOAL_CHUNK_ENTRIES//max(1, cells.size))
+    for first in range(0, len(goals), block):
+        d_row, d_col = rows[:, None] - goals[first:first+block, 0], cols[:, None] - goals[first:first+block, 1]
+        distances = d_row**2 + d_col**2 if heuristic_type == 'euclidian' else np.abs(d_row) + np.abs(d_col)
+        block_nearest = distances.argmin(axis=1)
+        block_h = distances[np.arange(cells.size), block_nearest]
+        if heuristic_type == 'euclidian': block_h = np.sqrt(block_h)
+        closer = block_h < h
+        h[closer], nearest[closer] = block_h[closer], block_nearest[closer] + first
+    return h, nearest
+
+
+def passable_steps(grid, costs=None, reverse=False):
+    # For each of the grid's moves (see SquareGrid.grid_steps): the flat index offset, the distance moved, and a flat
+    # boolean array marking the cells from which that step stays on the grid and lands on an accessible cell (reverse
+    # negates the moves, so the cells a move is made from become the cells it lands on)
+    height, width = grid.dimensions
+    costs = flat_costs(grid) if costs is None else costs
+    accessible = (costs != 0).reshape(height, width)
+    steps = []
+    for d_row, d_col, distance, cells in grid.grid_steps():
+        landing = accessible
+        if reverse:
+            d_row, d_col = -d_row, -d_col
+            if cells is not None: landing, cells = accessible & cells, None
+        passable = np.zeros((height, width), dtype=bool)
+        source = (slice(max(0, -d_row), height - max(0, d_row)), slice(max(0, -d_col), width - max(0, d_col)))
+        target = (slice(max(0, d_row), height - max(0, -d_row)), slice(max(0, d_col), width - max(0, -d_col)))
+        passable[source] = landing[target]
+        if cells is not None: passable &= cells
+        steps.append((d_row*width + d_col, distance, passable.ravel()))
+    return steps
+
+
+def reconstruct_grid_path(parents, index, width):
+    path = []
+    while index != -1:
+        path.append(divmod(int(index), width))
+        index = parents[index]
+    return path[::-1]
+
+
+def search_grid_a_star(grid, heuristic_type, save_history=False, max_iterations=10**6):
+    # search_grid, recording its history in a timestamped directory if save_history
+    recorder = HistoryRecorder(new_history_directory(), grid) if save_history else None
+    try: return search_grid(grid, heuristic_type, max_iterations, recorder)
+    finally:
+        if recorder: recorder.close()
+
+
+def search_grid(grid, heuristic_type, max_iterations=10**6, recorder=None):
+    # Returns (label path or None, iterations)
+
+    height, width = grid.dimensions
+    costs = flat_costs(grid)
+    start, end = grid.label_to_index(grid.start), grid.label_to_index(grid.end)
+    if costs[start] == 0 or costs[end] == 0: raise Exception('Start and end nodes must both be accessible.')
+
+    h = grid_heuristic(grid, grid.end, heuristic_type)
+    steps = passable_steps(grid, costs)
+
+    # Flat search state
+    g = np.full(height*width, np.inf)
+    parents = np.full(height*width, -1, dtype=np.int64)
+    closed = np.zeros(height*width, dtype=bool)
+
+    g[start] = 0
+    open_heap, count = [(0, 0, start)], 1
+    if recorder: recorder.record_index(0, PUSHED, start)
+    iterations, current = 0, start
+    while open_heap:
+        current = heapq.heappop(open_heap)[2]
+        # Skip superseded heap entries
+        if closed[current]: continue
+
+        iterations += 1
+        if iterations > max_iterations:
+            _logger.error('Exceeded max_iterations ({}), returning path so far.'.format(max_iterations))
+            return reconstruct_grid_path(parents, current, width), iterations
+
+        closed[current] = True
+        if recorder: recorder.record_index(iterations, EXPANDED, current, -1, g[current], g[current] + h[current])
+        if current == end: return reconstruct_grid_path(parents, current, width), iterations
+
+        current_g, leave_cost = g[current], costs[current]
+        for offset, distance, passable in steps:
+            if not passable[current]: continue
+            child = current + offset
+            if closed[child]: continue
+            child_g = current_g + leave_cost*distance
+            if child_g >= g[child]: continue
+            g[child], parents[child] = child_g, current
+            heapq.heappush(open_heap, (child_g + h[child], count, child))
+            if recorder: recorder.record_index(iterations, PUSHED, child, current, child_g, child_g + h[child])
+            count += 1
+
+    return None, iterations
+
+
+def search_grid_bidirectional(grid, heuristic_type, max_iterations=10**6):
+    # Returns (label path or None, iterations)
+
+    costs = flat_costs(grid)
+    start, end = grid.label_to_index(grid.start), grid.label_to_index(grid.end)
+    if costs[start] == 0 or costs[end] == 0: raise Exception('Start and end nodes must both be accessible.')
+
+    # Scaled by the cheapest cell so the estimates stay consistent (and manhattan by 1/sqrt(2) on diagonal grids)
+    scale = costs[costs != 0].min()/(SQRT2 if heuristic_type == 'manhattan' and grid._diagonality else 1)
+    potential = average_potential(grid_heuristic(grid, grid.end, heuristic_type)*scale,
+                                  grid_heuristic(grid, grid.start, heuristic_type)*scale)
+
+    # A step leaves the cell it starts from, so backwards the cost is that of the predecessor
+    steps, reverse_steps = passable_steps(grid, costs), passable_steps(grid, costs, reverse=True)
+    cost_list = costs.tolist()
+    def forward_edges(index):
+        return [(index + offset, cost_list[index]*distance) for offset, distance, passable in steps if passable[index]]
+    def backward_edges(index):
+        return [(index + offset, cost_list[index + offset]*distance) for offset, distance, passable in reverse_steps if passable[index]]
+
+    path, iterations = search_bidirectional(costs.size, start, end, forward_edges, backward_edges, potential, max_iterations)
+    return (None if path is None else [grid.index_to_label(index) for index in path]), iterations
+
+
+def search_grid_goals(grid, goals, heuristic_type, n_goals=1, max_iterations=10**6):
+    # Paths from the start to the n_goals nearest of goals (all of them if n_goals is None) in one search. Returns
+    # ({goal label: label path}, iterations), nearest goal first.
+
+    costs = flat_costs(grid)
+    goals = list(goals)
+    start, goal_ids = grid.label_to_index(grid.start), [grid.label_to_index(goal) for goal in goals]
+    if costs[start] == 0 or not costs[goal_ids].all(): raise Exception('Start and end nodes must all be accessible.')
+
+    steps, cost_list = passable_steps(grid, costs), costs.tolist()
+    def edges(index):
+        return [(index + offset, cost_list[index]*distance) for offset, distance, passable in steps if passable[index]]
+
+    heuristic = None
+    if heuristic_type:
+        # Scaled as for bidirectional search, so the estimates stay consistent. Each cell remembers its nearest goal, so
+        # once goals are reached only the cells that were nearest to them need their bound recomputing.
+        scale = costs[costs != 0].min()/(SQRT2 if heuristic_type == 'manhattan' and grid._diagonality else 1)
+        h, nearest = goal_heuristic(grid, goals, heuristic_type)
+        h_list = (h*scale).tolist()
+        def heuristic(remaining):
+            left = np.array([goal in remaining for goal in goal_ids])
+            cells = np.flatnonzero(~left[nearest])
+            if cells.size:
+                left = np.flatnonzero(left)
+                cell_h, cell_nearest = goal_heuristic(grid, [goals[i] for i in left], heuristic_type, cells)
+                nearest[cells] = left[cell_nearest]
+                for cell, value in zip(cells.tolist(), (cell_h*scale).tolist()): h_list[cell] = value
+            return h_list
+
+    paths, iterations = search_goals(costs.size, start, goal_ids, edges, heuristic, n_goals, max_iterations)
+    return {grid.index_to_label(goal): [grid.index_to_label(index) for index in path] for goal, path in paths.items()}, iterations
+
+
+def grid_distance_field(grid, source, reverse=False):
+    # Dijkstra sweep from source over the whole grid. Returns (distances, predecessors) shaped like maze_array, with
+    # predecessors holding flat indices (-1 for the source and unreachable cells). With reverse=True the distances
+    # are costs of reaching source and predecessors hold the next cell towards it.
+
+    height, width = grid.dimensions
+    costs = flat_costs(grid)
+    source = grid.label_to_index(source)
+    steps = passable_steps(grid, costs, reverse)
+
+    distances = np.full(height*width, np.inf)
+    predecessors = np.full(height*width, -1, dtype=np.int64)
+    closed = np.zeros(height*width, dtype=bool)
+
+    distances[source] = 0
+    open_heap = [(0, source)]
+    while open_heap:
+        current_distance, current = heapq.heappop(open_heap)
+        if closed[current]: continue
+        closed[current] = True
+
+        for offset, distance, passable in steps:
+            if not passable[current]: continue
+            neighbour = current + offset
+            if closed[neighbour]: continue
+            # Moving forwards leaves the current cell, moving backwards leaves the neighbour
+            neighbour_distance = current_distance + (costs[neighbour] if reverse else costs[current])*distance
+            if neighbour_distance >= distances[neighbour]: continue
+            distances[neighbour], predecessors[neighbour] = neighbour_distance, current
+            heapq.heappush(open_heap, (neighbour_distance, neighbour))
+
+    return distances.reshape(height, width), predecessors.reshape(height, width)
+
+
+def grid_wavefront_distances(grid, sources):
+    # Vectorised Bellman-Ford relaxation from several sources at once, returning forward distances shaped
+    # (len(sources),) + dimensions. Whole-array sweeps beat repeated heap searches on small grids (e.g. HPA* clusters).
+    height, width = grid.dimensions
+    costs = np.asarray(grid.maze_array, dtype=float)
+    accessible = costs != 0
+    distances = np.full((len(sources), height, width), np.inf)
+    for i, source in enumerate(sources): distances[(i,) + tuple(source)] = 0
+
+    # Cost of leaving each cell by each delta (infinite from walls, so nothing propagates through them)
+    moves = []
+    for d_row, d_col in grid_deltas(grid):
+        source = (slice(max(0, -d_row), height - max(0, d_row)), slice(max(0, -d_col), width - max(0, d_col)))
+        target = (slice(max(0, d_row), height - max(0, -d_row)), slice(max(0, d_col), width - max(0, -d_col)))
+        leave_costs = np.where(accessible, costs*(SQRT2 if d_row and d_col else 1.0), np.inf)[source]
+        moves.append(((slice(None),) + source, (slice(None),) + target, leave_costs))
+
+    while True:
+        previous = distances.copy()
+        for source, target, leave_costs in moves:
+            np.minimum(distances[target], distances[source] + leave_costs, out=distances[target])
+        if np.array_equal(previous, distances):
+            distances[:, ~accessible] = np.inf
+            return distances
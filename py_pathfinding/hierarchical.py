@@ -0,0 +1,263 @@
+import heapq
+import pickle
+import numpy as np
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+import grid_search
+
+
+# Hierarchical pathfinding (HPA*) over a SquareGrid. maze_array is partitioned into square clusters; entrances are
+# chosen along each border between neighbouring clusters, and the costs between the entrances of a cluster are
+# precomputed with local Dijkstra sweeps. A query connects its start and end to the entrances of their clusters,
+# searches the small abstract graph and then refines each intra-cluster hop with a local search.
+#
+# Transitions between clusters are stored per owning cluster: each cluster owns its east and south borders and its
+# south-east and south-west corners. Straight crossings are grouped into runs along a border, with one entrance pair
+# in the middle of short runs and one at each end of long ones. Diagonal crossings are only kept where neither of
+# the two straight detours around them is open, which is enough to keep every connection in the grid.
+
+LONG_RUN = 6
+
+
+class ClusterAbstraction:
+
+    def __init__(self, grid, cluster_size=16, build=True):
+        self.grid = grid
+        self.cluster_size = cluster_size
+        self.shape = grid.dimensions
+        self.diagonality = grid._diagonality
+        self.cluster_shape = (-(-self.shape[0] // cluster_size), -(-self.shape[1] // cluster_size))
+        self.transitions = {}           # owner cluster: [(cell, cell)] crossings (flat indices)
+        self.crossings = {}             # entrance: {entrance in a neighbouring cluster: cost of crossing}
+        self.cluster_entrances = {}     # cluster: {entrance}
+        self.intra = {}                 # cluster: {entrance: {entrance: cost}} (directed)
+        # Cheapest accessible cell cost, scaling the abstract search's straight-line heuristic
+        accessible_costs = np.asarray(grid.maze_array)[np.asarray(grid.maze_array) != 0]
+        self.cheapest_cost = accessible_costs.min() if accessible_costs.size else 1
+        if build: self.build()
+
+    def build(self):
+        clusters = [(row, col) for row in range(self.cluster_shape[0]) for col in range(self.cluster_shape[1])]
+        for cluster in clusters: self._set_transitions(cluster, self._find_transitions(cluster))
+        for cluster in clusters: self.intra[cluster] = self._intra_costs(cluster)
+        _logger.info('Built cluster abstraction with {} clusters and {} entrances.'.format(len(clusters), len(self.crossings)))
+
+    def save(self, filename):
+        with open(str(filename), 'wb') as file:
+            pickle.dump({'shape': self.shape, 'cluster_size': self.cluster_size, 'diagonality': self.diagonality,
+                         'transitions': self.transitions, 'intra': self.intra}, file)
+
+    @classmethod
+    def load(cls, grid, filename):
+        with open(str(filename), 'rb') as file: saved = pickle.load(file)
+        if saved['shape'] != grid.dimensions or saved['diagonality'] != grid._diagonality:
+            raise Exception('Saved cluster abstraction does not match the grid\'s dimensions or diagonality.')
+        abstraction = cls(grid, saved['cluster_size'], build=False)
+        for owner, pairs in saved['transitions'].items(): abstraction._set_transitions(owner, pairs)
+        abstraction.intra = saved['intra']
+        return abstraction
+
+    def update_cells(self, cells):
+        # Rebuild the parts of the abstraction affected by changes to the given cells of maze_array: the transitions
+        # whose cells (or corner detours) lie in a changed cluster, and the intra-cluster costs of changed clusters and
+        # of any cluster whose entrances changed as a result
+        changed_clusters = {self.cluster_of(cell) for cell in cells}
+        changed_costs = [self.grid.maze_array[cell] for cell in cells if self.grid.maze_array[cell] != 0]
+        if changed_costs: self.cheapest_cost = min(self.cheapest_cost, min(changed_costs))
+        owners = set()
+        for row, col in changed_clusters:
+            owners |= {(row, col), (row, col-1), (row, col+1), (row-1, col), (row-1, col-1), (row-1, col+1)}
+        owners = self._on_grid(owners)
+        neighbourhood = self._on_grid({(row+d_row, col+d_col) for row, col in owners for d_row in (0, 1) for d_col in (-1, 0, 1)})
+        entrances_before = {cluster: set(self.entrances(cluster)) for cluster in neighbourhood}
+        for owner in owners: self._set_transitions(owner, self._find_transitions(owner))
+        for cluster in neighbourhood:
+            if cluster in changed_clusters or self.entrances(cluster) != entrances_before[cluster]:
+                self.intra[cluster] = self._intra_costs(cluster)
+
+    def cluster_of(self, label): return label[0] // self.cluster_size, label[1] // self.cluster_size
+
+    def cluster_bounds(self, cluster):
+        row, col = cluster[0]*self.cluster_size, cluster[1]*self.cluster_size
+        return row, min(row + self.cluster_size, self.shape[0]), col, min(col + self.cluster_size, self.shape[1])
+
+    def entrances(self, cluster): return self.cluster_entrances.get(cluster, set())
+
+    def _on_grid(self, clusters):
+        return {(row, col) for row, col in clusters if 0 <= row < self.cluster_shape[0] and 0 <= col < self.cluster_shape[1]}
+
+    def _set_transitions(self, owner, pairs):
+        for a, b in self.transitions.get(owner, []):
+            self._remove_crossing(a, b)
+            self._remove_crossing(b, a)
+        self.transitions[owner] = pairs
+        for a, b in pairs:
+            self._add_crossing(a, b)
+            self._add_crossing(b, a)
+
+    def _add_crossing(self, a, b):
+        label_a, label_b = divmod(a, self.shape[1]), divmod(b, self.shape[1])
+        if a not in self.crossings:
+            self.crossings[a] = {}
+            self.cluster_entrances.setdefault(self.cluster_of(label_a), set()).add(a)
+        distance = grid_search.SQRT2 if (label_a[0] != label_b[0] and label_a[1] != label_b[1]) else 1
+        self.crossings[a][b] = self.grid.maze_array[label_a]*distance
+
+    def _remove_crossing(self, a, b):
+        crossings = self.crossings[a]
+        del crossings[b]
+        if not crossings:
+            del self.crossings[a]
+            self.cluster_entrances[self.cluster_of(divmod(a, self.shape[1]))].discard(a)
+
+    def _find_transitions(self, cluster):
+        width = self.shape[1]
+        row_0, row_1, col_0, col_1 = self.cluster_bounds(cluster)
+        pairs = []
+
+        # Accessibility of the cluster plus a one-cell margin to the south, west and east, addressed in grid coordinates
+        window = (np.asarray(self.grid.maze_array[row_0:row_1+1, max(col_0-1, 0):col_1+1]) != 0)
+        def accessible(row, col): return window[row - row_0, col - max(col_0-1, 0)]
+
+        # East and south borders: runs of straight crossings, plus isolated diagonal ones within the border
+        if col_1 < self.shape[1]:
+            inside, outside = window[:row_1-row_0, col_1-1-max(col_0-1, 0)], window[:row_1-row_0, col_1-max(col_0-1, 0)]
+            cells = [(row, col_1-1) for row in range(row_0, row_1)]
+            pairs += self._border_pairs(inside, outside, cells, (0, 1))
+        if row_1 < self.shape[0]:
+            inside = window[row_1-1-row_0, col_0-max(col_0-1, 0):col_1-max(col_0-1, 0)]
+            outside = window[row_1-row_0, col_0-max(col_0-1, 0):col_1-max(col_0-1, 0)]
+            cells = [(row_1-1, col) for col in range(col_0, col_1)]
+            pairs += self._border_pairs(inside, outside, cells, (1, 0))
+
+        # South-east and south-west corners
+        if self.diagonality and row_1 < self.shape[0]:
+            if col_1 < self.shape[1] and accessible(row_1-1, col_1-1) and accessible(row_1, col_1) \
+                    and not accessible(row_1-1, col_1) and not accessible(row_1, col_1-1):
+                pairs.append(((row_1-1, col_1-1), (row_1, col_1)))
+            if col_0 > 0 and accessible(row_1-1, col_0) and accessible(row_1, col_0-1) \
+                    and not accessible(row_1-1, col_0-1) and not accessible(row_1, col_0):
+                pairs.append(((row_1-1, col_0), (row_1, col_0-1)))
+
+        return [(a[0]*width + a[1], b[0]*width + b[1]) for a, b in pairs]
+
+    def _border_pairs(self, inside, outside, cells, crossing):
+        # inside/outside: accessibility of the cells either side of a border; cells: the inside labels;
+        # crossing: the delta from an inside cell to the cell facing it
+        pairs = []
+        straight = np.concatenate([[False], inside & outside, [False]])
+        run_edges = np.flatnonzero(np.diff(straight.astype(np.int8)))
+        for first, last in zip(run_edges[::2], run_edges[1::2] - 1):
+            chosen = [(first + last) // 2] if last - first + 1 < LONG_RUN else [first, last]
+            pairs += [(cells[i], (cells[i][0] + crossing[0], cells[i][1] + crossing[1])) for i in chosen]
+        if self.diagonality:
+            # Diagonal crossings along the border, kept only if both straight detours around them are closed
+            for i in range(len(cells) - 1):
+                for a, b in ((i, i+1), (i+1, i)):
+                    if inside[a] and outside[b] and not inside[b] and not outside[a]:
+                        pairs.append((cells[a], (cells[b][0] + crossing[0], cells[b][1] + crossing[1])))
+        return pairs
+
+    def _local_grid(self, bounds):
+        row_0, row_1, col_0, col_1 = bounds
+        local = type(self.grid)(self.grid.heuristic_type, diagonality=self.diagonality,
+                                maze_array=self.grid.maze_array[row_0:row_1, col_0:col_1])
+        return local, row_0, col_0
+
+    def _intra_costs(self, cluster):
+        local, row_0, col_0 = self._local_grid(self.cluster_bounds(cluster))
+        width = self.shape[1]
+        entrances = list(self.entrances(cluster))
+        if not entrances: return {}
+        local_labels = [(node // width - row_0, node % width - col_0) for node in entrances]
+        distances = grid_search.grid_wavefront_distances(local, local_labels)
+        costs = {}
+        for i, node in enumerate(entrances):
+            costs[node] = {other: distances[(i,) + label] for other, label in zip(entrances, local_labels)
+                           if other != node and np.isfinite(distances[(i,) + label])}
+        return costs
+
+    def search(self, start, end):
+        # Returns (label path or None, abstract nodes expanded)
+        width = self.shape[1]
+        start_node, end_node = start[0]*width + start[1], end[0]*width + end[1]
+        start_cluster, end_cluster = self.cluster_of(start), self.cluster_of(end)
+
+        # Temporary edges from the start to its cluster's entrances, and from the end cluster's entrances to the end
+        local, row_0, col_0 = self._local_grid(self.cluster_bounds(start_cluster))
+        distances = local.distance_field((start[0] - row_0, start[1] - col_0))[0]
+        start_edges = {node: distances[node // width - row_0, node % width - col_0] for node in self.entrances(start_cluster)}
+        local, row_0, col_0 = self._local_grid(self.cluster_bounds(end_cluster))
+        distances = local.distance_field((end[0] - row_0, end[1] - col_0), reverse=True)[0]
+        end_edges = {node: distances[node // width - row_0, node % width - col_0] for node in self.entrances(end_cluster)}
+        if start_cluster == end_cluster and np.isfinite(distances[start[0] - row_0, start[1] - col_0]):
+            start_edges[end_node] = distances[start[0] - row_0, start[1] - col_0]
+
+        # Abstract A*, with straight-line distance times the cheapest cell cost as an admissible heuristic
+        def h(node): return self.cheapest_cost*np.hypot(node // width - end[0], node % width - end[1])
+
+        g, parents, closed = {start_node: 0}, {start_node: None}, set()
+        open_heap, count, iterations = [(h(start_node), 0, start_node)], 1, 0
+        while open_heap:
+            current = heapq.heappop(open_heap)[2]
+            if current in closed: continue
+            closed.add(current)
+            iterations += 1
+            if current == end_node: return self._nearby_or_refined(start, end, g[end_node], parents), iterations
+
+            edges = list(self.crossings.get(current, {}).items())
+            if current == start_node: edges += start_edges.items()
+            else:
+                edges += self.intra.get(self.cluster_of(divmod(current, width)), {}).get(current, {}).items()
+                if current in end_edges: edges.append((end_node, end_edges[current]))
+            for child, cost in edges:
+                if child in closed or not np.isfinite(cost): continue
+                child_g = g[current] + cost
+                if child_g >= g.get(child, np.inf): continue
+                g[child], parents[child] = child_g, current
+                heapq.heappush(open_heap, (child_g + h(child), count, child))
+                count += 1
+
+        return None, iterations
+
+    def _nearby_or_refined(self, start, end, abstract_cost, parents):
+        # Abstract paths between neighbouring clusters can detour a long way to an entrance, so also search the box
+        # covering both clusters directly and keep the cheaper path
+        start_cluster, end_cluster = self.cluster_of(start), self.cluster_of(end)
+        if max(abs(start_cluster[0] - end_cluster[0]), abs(start_cluster[1] - end_cluster[1])) <= 1:
+            start_bounds, end_bounds = self.cluster_bounds(start_cluster), self.cluster_bounds(end_cluster)
+            bounds = (min(start_bounds[0], end_bounds[0]), max(start_bounds[1], end_bounds[1]),
+                      min(start_bounds[2], end_bounds[2]), max(start_bounds[3], end_bounds[3]))
+            local, row_0, col_0 = self._local_grid(bounds)
+            field = local.distance_field((start[0] - row_0, start[1] - col_0))
+            local_end = (end[0] - row_0, end[1] - col_0)
+            if field[0][local_end] < abstract_cost:
+                return [(row + row_0, col + col_0) for row, col in local.path_from_field(field, local_end)]
+        return self._refine(parents, end[0]*self.shape[1] + end[1])
+
+    def _refine(self, parents, node):
+        width = self.shape[1]
+        abstract_path = []
+        while node is not None:
+            abstract_path.append(divmod(node, width))
+            node = parents[node]
+        abstract_path = abstract_path[::-1]
+
+        path = abstract_path[:1]
+        for source, target in zip(abstract_path, abstract_path[1:]):
+            if self.cluster_of(source) != self.cluster_of(target):
+                path.append(target)
+                continue
+            local, row_0, col_0 = self._local_grid(self.cluster_bounds(self.cluster_of(source)))
+            local.start, local.end = (source[0] - row_0, source[1] - col_0), (target[0] - row_0, target[1] - col_0)
+            local_path = grid_search.search_grid(local, self.grid.heuristic_type)[0]
+            path += [(row + row_0, col + col_0) for row, col in local_path[1:]]
+        return path
+
+
+def search_hierarchical(grid):
+    # Returns (label path or None, abstract nodes expanded), building the grid's cluster abstraction on first use
+    if grid.hierarchy is None: grid.hierarchy = ClusterAbstraction(grid)
+    return grid.hierarchy.search(grid.start, grid.end)
@@ -0,0 +1,97 @@
+import pickle
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+from nicpy import nic_misc
+from search_result import SearchObserver
+
+
+# Compact search history: one append-only binary event log per search (plus a single pickle of the graph). Each
+# record is a delta - a node expanded, or a node pushed with its parent and g/f values - addressed by the graph's
+# flat node index. Records are written in iteration order, so the memory-mapped iteration column is its own
+# checkpoint index: the state at any iteration is rebuilt from the records before a binary-searched offset.
+
+MAGIC = b'PFHIST01'
+EXPANDED, PUSHED = 0, 1
+EVENT_DTYPE = np.dtype([('iteration', '<u4'), ('kind', 'u1'), ('node', '<i8'), ('parent', '<i8'),
+                        ('g', '<f8'), ('f', '<f8')])
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('record_size', '<u4')])
+EVENTS_FILENAME, GRAPH_FILENAME = 'events.bin', 'graph.dat'
+
+
+def new_history_directory():
+    save_directory = Path.cwd()/'saved_histories'/datetime.now().strftime('%Y-%m-%d_%H_%M_%S')
+    nic_misc.mkdir_if_DNE(save_directory)
+    _logger.info('Saving algo history to: {}'.format(str(save_directory)))
+    return save_directory
+
+
+class HistoryRecorder(SearchObserver):
+
+    def __init__(self, save_directory, graph, buffer_size=4096):
+        self.graph = graph
+        self._buffer, self._buffer_size = [], buffer_size
+        with open(str(save_directory/GRAPH_FILENAME), 'wb') as graph_file: pickle.dump(graph, graph_file)
+        self._file = open(str(save_directory/EVENTS_FILENAME), 'wb')
+        np.array([(MAGIC, EVENT_DTYPE.itemsize)], dtype=HEADER_DTYPE).tofile(self._file)
+
+    def expanded(self, iteration, node):
+        self.record_index(iteration, EXPANDED, node.index, -1, node.g, node.f)
+
+    def pushed(self, iteration, node):
+        self.record_index(iteration, PUSHED, node.index, node.parent_index, node.g, node.f)
+
+    def record_index(self, iteration, kind, node, parent=-1, g=0.0, f=0.0):
+        # Index-based entry point for solvers that don't create nodes
+        self._buffer.append((iteration, kind, node, parent, g, f))
+        if len(self._buffer) >= self._buffer_size: self.flush()
+
+    def flush(self):
+        if self._buffer: np.array(self._buffer, dtype=EVENT_DTYPE).tofile(self._file)
+        self._buffer = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class SearchHistory:
+
+    def __init__(self, history_directory):
+        with open(str(history_directory/GRAPH_FILENAME), 'rb') as graph_file: self.graph = pickle.load(graph_file)
+        header = np.fromfile(str(history_directory/EVENTS_FILENAME), dtype=HEADER_DTYPE, count=1)
+        if header.size == 0 or header['magic'][0] != MAGIC or header['record_size'][0] != EVENT_DTYPE.itemsize:
+            raise Exception('{} is not a search history event log.'.format(history_directory/EVENTS_FILENAME))
+        self.events = np.memmap(str(history_directory/EVENTS_FILENAME), dtype=EVENT_DTYPE, mode='r',
+                                offset=HEADER_DTYPE.itemsize)
+        self.iterations = int(self.events['iteration'][-1]) if self.events.size else 0
+
+    def offset(self, iteration):
+        # Number of records belonging to iterations <= iteration
+        return int(np.searchsorted(self.events['iteration'], iteration, side='right'))
+
+    def state(self, iteration):
+        # Returns (current_label, current_path, closed_labels, open_labels) after the given number of expansions
+        events = self.events[:self.offset(iteration)]
+        expanded = events['node'][events['kind'] == EXPANDED]
+        pushes = events[events['kind'] == PUSHED]
+
+        # The latest push of a node holds its current parent
+        pushed_nodes, latest = np.unique(pushes['node'][::-1], return_index=True)
+        parents = pushes['parent'][::-1][latest]
+        queued = np.setdiff1d(pushed_nodes, expanded)
+
+        current = int(expanded[-1]) if expanded.size else int(pushes['node'][0])
+        current_path, node = [], current
+        while node != -1:
+            current_path.append(self.graph.index_to_label(node))
+            node = parents[np.searchsorted(pushed_nodes, node)]
+
+        return (self.graph.index_to_label(current), current_path[::-1],
+                [self.graph.index_to_label(node) for node in expanded.tolist()],
+                [self.graph.index_to_label(node) for node in queued.tolist()])
@@ -0,0 +1,215 @@
+import heapq
+import math
+import numpy as np
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+from nicpy import nic_misc
+from grid_search import SQRT2, grid_deltas
+
+
+# D* Lite (Koenig & Likhachev) for SquareGrids. The search runs backwards from the end, so g/rhs hold each cell's
+# cost to reach the end and survive between calls: when cells change only the vertices whose rhs is affected are
+# requeued, and when the start moves the key modifier km keeps the old queue keys valid. Cells are addressed by flat
+# index into the maze padded with a border of walls (so neighbour scans need no bounds checks), with the search state
+# in Python lists for fast scalar access.
+
+# Keys are sums of float step costs, so two paths of equal cost can give first key components an ulp or so apart;
+# components closer than this (relative) tolerance are treated as tied, and the second component decides
+KEY_TOLERANCE = 1e-9
+
+
+def key_less(key_a, key_b):
+    if math.isinf(key_a[0]) or math.isinf(key_b[0]): return key_a < key_b
+    tolerance = KEY_TOLERANCE*max(1.0, abs(key_a[0]), abs(key_b[0]))
+    if key_a[0] < key_b[0] - tolerance: return True
+    return abs(key_a[0] - key_b[0]) <= tolerance and key_a[1] < key_b[1] - tolerance
+
+
+def search_d_star_lite(grid, max_iterations=10**6):
+    # Returns (label path or None, iterations of this replan). Reuses the grid's planner while its end stays put, so
+    # repeated solves only repair the search.
+    planner = grid.planner
+    if planner is None or planner.end != grid.end: planner = grid.planner = DStarLite(grid, max_iterations=max_iterations)
+    else:
+        planner.max_iterations = max_iterations
+        if planner.start != grid.start: planner.move_to(grid.start)
+    path = planner.plan()
+    return path, planner.iterations
+
+
+class DStarLite:
+
+    def __init__(self, grid, heuristic_type='grid', max_iterations=10**6):
+        self.grid = grid
+        self.heuristic_type = grid.heuristic_type if heuristic_type == 'grid' else heuristic_type
+        self.max_iterations = max_iterations
+        self.height, self.width = grid.dimensions
+        self.moves = [(d_row*(self.width+2) + d_col, SQRT2 if d_row and d_col else 1.0) for d_row, d_col in grid_deltas(grid)]
+
+        self.start, self.end = grid.start, grid.end
+        start, end = self._to_index(grid.start), self._to_index(grid.end)
+        self._costs = np.asarray(grid.maze_array, dtype=float).copy()
+        self.costs = np.pad(self._costs, 1).ravel().tolist()
+        if self.costs[start] == 0 or self.costs[end] == 0: raise Exception('Start and end nodes must both be accessible.')
+        self.version = grid.version
+
+        size = len(self.costs)
+        self.g = [math.inf]*size
+        self.rhs = [math.inf]*size
+        self.queued = [None]*size     # key of each cell's live queue entry (None when not queued)
+        self.queue = []
+        self.km = 0
+        self.iterations = 0
+        self._path, self._path_indices = None, set()     # last extracted path, reused while nothing on it changes
+
+        self._start_index, self._end_index = start, end
+        self._set_heuristic(start)
+        self.rhs[end] = 0
+        self._push(end, (self.h(end), 0))
+
+    def _to_index(self, label): return (label[0]+1)*(self.width+2) + label[1]+1
+
+    def _to_label(self, index):
+        row, col = divmod(index, self.width+2)
+        return row-1, col-1
+
+    def _set_heuristic(self, start):
+        row, col = divmod(start, self.width+2)
+        width = self.width+2
+        if self.heuristic_type == 'euclidian': self.h = lambda index: math.hypot(index // width - row, index % width - col)
+        elif self.heuristic_type == 'manhattan': self.h = lambda index: abs(index // width - row) + abs(index % width - col)
+        elif self.heuristic_type is None: self.h = lambda index: 0
+        else: self.h = lambda index: nic_misc.distance(self.heuristic_type, (row, col), divmod(index, width))
+
+    def _key(self, index):
+        g = min(self.g[index], self.rhs[index])
+        return g + self.h(index) + self.km, g
+
+    def _push(self, index, key):
+        self.queued[index] = key
+        heapq.heappush(self.queue, (key, index))
+
+    def _update_vertex(self, index):
+        # Recompute rhs from the successors. Leaving a cell costs the cell's cost times the distance moved, and walls
+        # can be neither left nor entered.
+        costs, g = self.costs, self.g
+        if index != self._end_index:
+            leave_cost, best = costs[index], math.inf
+            if leave_cost != 0:
+                for offset, distance in self.moves:
+                    neighbour = index + offset
+                    if costs[neighbour] != 0 and g[neighbour] + leave_cost*distance < best: best = g[neighbour] + leave_cost*distance
+            self.rhs[index] = best
+        self._update_queue(index)
+
+    def _update_queue(self, index):
+        if self.g[index] != self.rhs[index]: self._push(index, self._key(index))
+        else: self.queued[index] = None
+
+    def _top(self):
+        # Drop superseded entries from the top of the queue, returning the live top key (or None)
+        queue, queued = self.queue, self.queued
+        while queue and queued[queue[0][1]] != queue[0][0]: heapq.heappop(queue)
+        return queue[0][0] if queue else None
+
+    def _compute_shortest_path(self):
+        start, g, rhs, costs = self._start_index, self.g, self.rhs, self.costs
+        iterations = 0
+        while True:
+            top = self._top()
+            if top is None or (not key_less(top, self._key(start)) and rhs[start] == g[start]): break
+            iterations += 1
+            if iterations > self.max_iterations:
+                _logger.error('Exceeded max_iterations ({}) while replanning.'.format(self.max_iterations))
+                break
+            index = heapq.heappop(self.queue)[1]
+            new_key = self._key(index)
+            if key_less(top, new_key):
+                self._push(index, new_key)
+                continue
+            self.queued[index] = None
+            end, moves = self._end_index, self.moves
+            # Neighbours are both the successors and the predecessors; walls have no edges to update
+            if g[index] > rhs[index]:
+                # Lowered: predecessors can only improve, through this cell
+                g_index = g[index] = rhs[index]
+                for offset, distance in moves:
+                    neighbour = index + offset
+                    if costs[neighbour] == 0 or neighbour == end: continue
+                    if costs[neighbour]*distance + g_index < rhs[neighbour]: rhs[neighbour] = costs[neighbour]*distance + g_index
+                    self._update_queue(neighbour)
+            else:
+                # Raised: only predecessors whose rhs came through this cell need a rescan
+                g_old, g[index] = g[index], math.inf
+                self._update_vertex(index)
+                for offset, distance in moves:
+                    neighbour = index + offset
+                    if costs[neighbour] == 0: continue
+                    if rhs[neighbour] == costs[neighbour]*distance + g_old: self._update_vertex(neighbour)
+        self.iterations = iterations
+
+    def _sync(self):
+        # Pick up any maze_array edits made since the last plan (e.g. through SquareGrid.update_cells)
+        if self.grid.version == self.version: return
+        costs = np.asarray(self.grid.maze_array, dtype=float)
+        changed = np.argwhere(costs != self._costs)
+        self.version = self.grid.version
+        self._apply({(row, col): costs[row, col] for row, col in changed.tolist()})
+
+    def _apply(self, changes):
+        affected = set()
+        for label, cost in changes.items():
+            index = self._to_index(label)
+            self._costs[label] = self.costs[index] = cost
+            if index in self._path_indices: self._path = None
+            # A cell's cost changes its outgoing edges, and walls also change the edges into them
+            affected.add(index)
+            affected.update(index + offset for offset, _ in self.moves)
+        for index in affected: self._update_vertex(index)
+
+    def update_cells(self, changes):
+        # Apply a {label: cost} dict of cell changes to the grid and return the repaired path. Changes made here are
+        # applied directly; edits made to the grid elsewhere are found by diffing maze_array on the next plan.
+        in_sync = self.grid.version == self.version
+        self.grid.update_cells(changes)
+        if in_sync:
+            self._apply(changes)
+            self.version = self.grid.version
+        return self.plan()
+
+    def move_to(self, label):
+        # Move the start (e.g. the agent stepping along the path); km keeps the queued keys consistent
+        if not self.grid.check_label_on_grid(label): raise Exception('Label {} is not on the grid (dimensions {}).'.format(label, self.grid.dimensions))
+        index = self._to_index(label)
+        self.km += self.h(index)
+        self.start, self._start_index = label, index
+        self._set_heuristic(index)
+        self._path = None
+
+    def plan(self):
+        # Returns the current optimal label path from start to end, or None when the end is unreachable
+        self._sync()
+        self._compute_shortest_path()
+        # With no vertices expanded g is unchanged, so the previous path stands unless one of its cells was edited
+        if self.iterations or self._path is None: self._path = self.path()
+        return None if self._path is None else list(self._path)
+
+    def path(self):
+        g, costs = self.g, self.costs
+        index = self._start_index
+        self._path_indices = {index}
+        if g[index] == math.inf: return None
+        path = [self._to_label(index)]
+        while index != self._end_index:
+            best, best_neighbour = math.inf, None
+            for offset, distance in self.moves:
+                neighbour = index + offset
+                if costs[neighbour] != 0 and costs[index]*distance + g[neighbour] < best:
+                    best, best_neighbour = costs[index]*distance + g[neighbour], neighbour
+            if best_neighbour is None or len(path) > len(g): return None
+            index = best_neighbour
+            self._path_indices.add(index)
+            path.append(self._to_label(index))
+        return path
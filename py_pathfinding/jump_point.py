@@ -0,0 +1,158 @@
+import heapq
+import numpy as np
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+from grid_search import SQRT2, flat_costs, heuristic_array
+
+
+# Jump Point Search for SquareGrids whose accessible cells all have the same cost. Only jump points are pushed to the
+# open heap: straight and diagonal runs are scanned without expanding the symmetric paths in between, and the path
+# between consecutive jump points is filled back in at the end. Diagonal moves follow SquareGrid.find_neighbours,
+# which does not check the cells beside a diagonal step. With diagonality off, the 4-connected variant scans
+# vertically, branching horizontally at each step, and stops horizontal runs only at forced turns.
+
+def uniform_cost(grid, costs=None):
+    costs = flat_costs(grid) if costs is None else costs
+    accessible_costs = np.unique(costs[costs != 0])
+    if accessible_costs.size != 1:
+        raise Exception('Jump Point Search requires every accessible cell to have the same cost.')
+    return accessible_costs[0]
+
+
+def search_jump_points(grid, heuristic_type, max_iterations=10**6):
+    # Returns (label path or None, iterations)
+
+    height, width = grid.dimensions
+    costs = flat_costs(grid)
+    if costs[grid.label_to_index(grid.start)] == 0 or costs[grid.label_to_index(grid.end)] == 0:
+        raise Exception('Start and end nodes must both be accessible.')
+    cost = uniform_cost(grid, costs)
+    jumper = _Jumper(costs.reshape(height, width) != 0, grid.end, grid._diagonality)
+
+    # Jump points are addressed by flat index; the heuristic is scaled by the uniform cost so it stays admissible
+    h = heuristic_array(grid.dimensions, grid.end, heuristic_type)*cost
+    g = np.full(height*width, np.inf)
+    parents = np.full(height*width, -1, dtype=np.int64)
+    closed = np.zeros(height*width, dtype=bool)
+
+    start, end = grid.label_to_index(grid.start), grid.label_to_index(grid.end)
+    g[start] = 0
+    open_heap, count = [(0, 0, start)], 1
+    iterations, current = 0, start
+    while open_heap:
+        current = heapq.heappop(open_heap)[2]
+        if closed[current]: continue
+
+        iterations += 1
+        if iterations > max_iterations:
+            _logger.error('Exceeded max_iterations ({}), returning path so far.'.format(max_iterations))
+            return _fill_path(parents, current, width), iterations
+
+        closed[current] = True
+        if current == end: return _fill_path(parents, current, width), iterations
+
+        row, col = divmod(current, width)
+        parent = parents[current]
+        direction = None if parent == -1 else _direction(divmod(int(parent), width), (row, col))
+        for d_row, d_col in jumper.successor_directions(row, col, direction):
+            jump_point = jumper.jump(row, col, d_row, d_col)
+            if jump_point is None: continue
+            child = jump_point[0]*width + jump_point[1]
+            if closed[child]: continue
+            steps = max(abs(jump_point[0] - row), abs(jump_point[1] - col))
+            child_g = g[current] + cost*steps*(SQRT2 if d_row and d_col else 1)
+            if child_g >= g[child]: continue
+            g[child], parents[child] = child_g, current
+            heapq.heappush(open_heap, (child_g + h[child], count, child))
+            count += 1
+
+    return None, iterations
+
+
+def _direction(source, target):
+    return int(np.sign(target[0] - source[0])), int(np.sign(target[1] - source[1]))
+
+
+def _fill_path(parents, index, width):
+    # Interpolate the straight or diagonal runs between consecutive jump points
+    jump_points = []
+    while index != -1:
+        jump_points.append(divmod(int(index), width))
+        index = parents[index]
+    jump_points = jump_points[::-1]
+    path = jump_points[:1]
+    for source, target in zip(jump_points, jump_points[1:]):
+        d_row, d_col = _direction(source, target)
+        steps = max(abs(target[0] - source[0]), abs(target[1] - source[1]))
+        path.extend((source[0] + d_row*step, source[1] + d_col*step) for step in range(1, steps+1))
+    return path
+
+
+class _Jumper:
+
+    def __init__(self, accessible, goal, diagonality):
+        # Walkability as nested lists with a blocked border, so scans need no bounds checks (coordinates are shifted
+        # by one inside the class)
+        padded = np.zeros((accessible.shape[0]+2, accessible.shape[1]+2), dtype=bool)
+        padded[1:-1, 1:-1] = accessible
+        self.walkable = padded.tolist()
+        self.goal = (goal[0]+1, goal[1]+1)
+        self.diagonality = diagonality
+        self.all_directions = [(-1, 0), (0, -1), (0, 1), (1, 0)]
+        if diagonality: self.all_directions += [(-1, -1), (1, 1), (-1, 1), (1, -1)]
+
+    def successor_directions(self, row, col, direction):
+        if direction is None: return self.all_directions
+        walkable, (r, c), (d_row, d_col) = self.walkable, (row+1, col+1), direction
+        if self.diagonality:
+            if d_row and d_col:
+                directions = [(d_row, 0), (0, d_col), (d_row, d_col)]
+                if not walkable[r-d_row][c]: directions.append((-d_row, d_col))
+                if not walkable[r][c-d_col]: directions.append((d_row, -d_col))
+            elif d_row:
+                directions = [(d_row, 0)]
+                if not walkable[r][c+1]: directions.append((d_row, 1))
+                if not walkable[r][c-1]: directions.append((d_row, -1))
+            else:
+                directions = [(0, d_col)]
+                if not walkable[r+1][c]: directions.append((1, d_col))
+                if not walkable[r-1][c]: directions.append((-1, d_col))
+            return directions
+        if d_row: return [(d_row, 0), (0, 1), (0, -1)]
+        directions = [(0, d_col)]
+        if walkable[r+1][c] and not walkable[r+1][c-d_col]: directions.append((1, 0))
+        if walkable[r-1][c] and not walkable[r-1][c-d_col]: directions.append((-1, 0))
+        return directions
+
+    def jump(self, row, col, d_row, d_col):
+        # Returns the next jump point (unshifted) from (row, col) in the given direction, or None
+        found = self._jump_diagonal(row+1, col+1, d_row, d_col) if d_row and d_col else self._jump_straight(row+1, col+1, d_row, d_col)
+        return None if found is None else (found[0]-1, found[1]-1)
+
+    def _jump_straight(self, r, c, d_row, d_col):
+        walkable, goal = self.walkable, self.goal
+        while True:
+            r, c = r + d_row, c + d_col
+            if not walkable[r][c]: return None
+            if (r, c) == goal: return r, c
+            if self.diagonality:
+                # Forced neighbours: a blocked cell beside the run with an open cell diagonally ahead of it
+                if d_row:
+                    if (not walkable[r][c+1] and walkable[r+d_row][c+1]) or (not walkable[r][c-1] and walkable[r+d_row][c-1]): return r, c
+                elif (not walkable[r+1][c] and walkable[r+1][c+d_col]) or (not walkable[r-1][c] and walkable[r-1][c+d_col]): return r, c
+            elif d_row:
+                # Vertical runs branch horizontally at every step
+                if self._jump_straight(r, c, 0, 1) is not None or self._jump_straight(r, c, 0, -1) is not None: return r, c
+            # Horizontal runs stop where a cell beside the run can't have been reached from behind
+            elif (walkable[r+1][c] and not walkable[r+1][c-d_col]) or (walkable[r-1][c] and not walkable[r-1][c-d_col]): return r, c
+
+    def _jump_diagonal(self, r, c, d_row, d_col):
+        walkable, goal = self.walkable, self.goal
+        while True:
+            r, c = r + d_row, c + d_col
+            if not walkable[r][c]: return None
+            if (r, c) == goal: return r, c
+            if (not walkable[r-d_row][c] and walkable[r-d_row][c+d_col]) or (not walkable[r][c-d_col] and walkable[r+d_row][c-d_col]): return r, c
+            if self._jump_straight(r, c, d_row, 0) is not None or self._jump_straight(r, c, 0, d_col) is not None: return r, c
@@ -0,0 +1,68 @@
+import numpy as np
+from pathlib import Path
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+import network_search
+from contraction import network_fingerprint
+
+
+# ALT (A*, Landmarks, Triangle inequality) heuristics for Networks. A few landmarks are picked far apart (each the
+# place furthest from those already picked) and a Dijkstra sweep stores every place's distance to each. The triangle
+# inequality then bounds the distance from any place v to a target t from below by |d(L, t) - d(L, v)| for every
+# landmark L. Network edges are symmetric, so one table holds the distances both from and to the landmarks. Places a
+# landmark can't reach are stored as NaN, and ignored by the bounds.
+
+DEFAULT_LANDMARKS = 16
+LANDMARKS_SUFFIX = '.landmarks.npz'   # landmark tables saved next to a binary network file, see Network.save_binary
+
+
+class LandmarkTable:
+
+    def __init__(self, network, n_landmarks=DEFAULT_LANDMARKS, seed=None, build=True):
+        self.network = network
+        self.landmarks = []         # node IDs
+        self.distances = None       # (places, landmarks) array, so each place's distances are contiguous
+        if build: self.build(n_landmarks, seed)
+
+    def build(self, n_landmarks=DEFAULT_LANDMARKS, seed=None):
+        n_places = len(self.network.labels)
+        # Farthest-point selection, starting from the place furthest from a random one. Places unreachable from
+        # every landmark so far count as furthest, so every component gets a landmark before any gets a second.
+        nearest = network_search.network_distance_field(self.network, int(np.random.default_rng(seed).integers(n_places)))[0]
+        columns = []
+        for _ in range(min(n_landmarks, n_places)):
+            landmark = int(np.argmax(nearest))
+            if self.landmarks and nearest[landmark] == 0: break
+            distances = network_search.network_distance_field(self.network, landmark)[0]
+            nearest = distances if not columns else np.minimum(nearest, distances)
+            self.landmarks.append(landmark)
+            columns.append(distances)
+        self.distances = np.where(np.isinf(columns), np.nan, columns).T.copy()
+        _logger.info('Picked {} landmarks for {} places.'.format(len(self.landmarks), n_places))
+
+    def lower_bound(self, node_id, target_id):
+        bound = np.fmax.reduce(np.abs(self.distances[node_id] - self.distances[target_id]))
+        return 0.0 if bound != bound else float(bound)
+
+    def lower_bounds(self, target_id):
+        # Bounds from every place to target_id
+        bounds = np.fmax.reduce(np.abs(self.distances - self.distances[target_id]), axis=1)
+        return np.nan_to_num(bounds, nan=0.0)
+
+    def save(self, filename):
+        np.savez_compressed(str(filename), landmarks=np.array(self.landmarks, dtype=np.int64), distances=self.distances,
+                            labels=np.array(self.network.labels, dtype=str), fingerprint=np.array(network_fingerprint(self.network)))
+
+    @classmethod
+    def load(cls, network, filename):
+        with np.load(str(filename)) as saved:
+            if str(saved['fingerprint']) != network_fingerprint(network) or saved['labels'].tolist() != list(network.labels):
+                raise Exception('Saved landmark table does not match the network.')
+            table = cls(network, build=False)
+            table.landmarks, table.distances = saved['landmarks'].tolist(), saved['distances']
+        return table
+
+
+def landmarks_filename(graph_filename): return Path(str(graph_filename) + LANDMARKS_SUFFIX)
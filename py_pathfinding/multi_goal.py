@@ -0,0 +1,62 @@
+import heapq
+import math
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+
+# Multi-goal A*/Dijkstra over flat node indices, shared by the grid and network engines: one search from the start
+# settles the goals in order of distance, so it can stop at the nearest (or the first n) or run on until every goal is
+# reached. The heuristic is a lower bound on the cost to the nearest goal not yet reached, which stays consistent if
+# each goal's bound is; whenever a goal is reached it is recomputed over the goals left and the open nodes re-keyed.
+# Nodes already expanded keep their (optimal) g, so every goal's path is still optimal.
+
+def search_goals(size, start, goals, edges, heuristic=None, n_goals=1, max_iterations=10**6):
+    # edges(i) returns (neighbour, cost) pairs for the edges leaving node i, and heuristic(goals) a per-node sequence
+    # of lower bounds on the cost to the nearest of goals (None searches blind). n_goals None reaches every goal.
+    # Returns ({goal: index path}, iterations), with the goals in the order they were reached (nearest first).
+    remaining = set(goals)
+    n_goals = len(remaining) if n_goals is None else min(n_goals, len(remaining))
+    h = heuristic(remaining) if heuristic else [0.0]*size
+
+    g, parents, closed = [math.inf]*size, [-1]*size, [False]*size
+    g[start] = 0
+    heap = [(h[start], start)]
+    paths, iterations = {}, 0
+    while heap:
+        current = heapq.heappop(heap)[1]
+        # Skip superseded heap entries
+        if closed[current]: continue
+
+        iterations += 1
+        if iterations > max_iterations:
+            _logger.error('Exceeded max_iterations ({}) with {} of {} goals reached.'.format(max_iterations, len(paths), n_goals))
+            return paths, iterations
+
+        closed[current] = True
+        if current in remaining:
+            paths[current] = _index_path(parents, current)
+            remaining.discard(current)
+            if len(paths) >= n_goals or not remaining: break
+            if heuristic:
+                h = heuristic(remaining)
+                heap = [(g[node] + h[node], node) for node in {node for _, node in heap if not closed[node]}]
+                heapq.heapify(heap)
+
+        current_g = g[current]
+        for child, cost in edges(current):
+            if closed[child]: continue
+            child_g = current_g + cost
+            if child_g >= g[child]: continue
+            g[child], parents[child] = child_g, current
+            heapq.heappush(heap, (child_g + h[child], child))
+
+    return paths, iterations
+
+
+def _index_path(parents, index):
+    path = []
+    while index != -1:
+        path.append(index)
+        index = parents[index]
+    return path[::-1]
@@ -0,0 +1,121 @@
+import heapq
+import numpy as np
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+from bidirectional import search_bidirectional
+from multi_goal import search_goals
+
+
+# Network solvers working directly on the CSR adjacency compiled by Network.load_graph. Places are addressed by
+# integer node ID and the search state lives in flat arrays, so no Place objects are created.
+
+def reconstruct_network_path(network, parents, node_id):
+    path = []
+    while node_id != -1:
+        path.append(network.labels[node_id])
+        node_id = parents[node_id]
+    return path[::-1]
+
+
+def search_network(network, max_iterations=10**6):
+    # Returns (label path or None, iterations)
+
+    indptr, indices, costs = network.indptr, network.indices, network.costs
+    start, end = network.label_to_index(network.start), network.label_to_index(network.end)
+
+    # Flat search state
+    g = np.full(len(network.labels), np.inf)
+    parents = np.full(len(network.labels), -1, dtype=np.int64)
+    closed = np.zeros(len(network.labels), dtype=bool)
+
+    g[start] = 0
+    open_heap, count = [(0, 0, start)], 1
+    iterations, current = 0, start
+    while open_heap:
+        current_g, _, current = heapq.heappop(open_heap)
+        # Skip superseded heap entries
+        if closed[current]: continue
+
+        iterations += 1
+        if iterations > max_iterations:
+            _logger.error('Exceeded max_iterations ({}), returning path so far.'.format(max_iterations))
+            return reconstruct_network_path(network, parents, current), iterations
+
+        closed[current] = True
+        if current == end: return reconstruct_network_path(network, parents, current), iterations
+
+        first, last = indptr[current], indptr[current+1]
+        for child, cost in zip(indices[first:last].tolist(), costs[first:last].tolist()):
+            if closed[child]: continue
+            child_g = current_g + cost
+            if child_g >= g[child]: continue
+            g[child], parents[child] = child_g, current
+            heapq.heappush(open_heap, (child_g, count, child))
+            count += 1
+
+    return None, iterations
+
+
+def search_network_bidirectional(network, max_iterations=10**6):
+    # Returns (label path or None, iterations). Edges are symmetric, so both searches scan the same adjacency.
+    indptr, indices, costs = network.indptr, network.indices, network.costs
+    def edges(node_id):
+        first, last = indptr[node_id], indptr[node_id+1]
+        return zip(indices[first:last].tolist(), costs[first:last].tolist())
+
+    start, end = network.label_to_index(network.start), network.label_to_index(network.end)
+    path, iterations = search_bidirectional(len(network.labels), start, end, edges, edges, None, max_iterations)
+    return (None if path is None else [network.labels[node_id] for node_id in path]), iterations
+
+
+def search_network_goals(network, goals, n_goals=1, max_iterations=10**6):
+    # Paths from the start to the n_goals nearest of goals (all of them if n_goals is None) in one search, guided by
+    # the landmark bounds if the network's heuristic_type is 'alt'. Returns ({goal label: label path}, iterations),
+    # nearest goal first.
+    indptr, indices, costs = network.indptr, network.indices, network.costs
+    def edges(node_id):
+        first, last = indptr[node_id], indptr[node_id+1]
+        return zip(indices[first:last].tolist(), costs[first:last].tolist())
+
+    heuristic = None
+    if network.heuristic_type == 'alt':
+        if network.landmarks is None: network.build_landmarks()
+        def heuristic(goal_ids):
+            goal_ids = list(goal_ids)
+            bounds = network.landmarks.lower_bounds(goal_ids[0])
+            for goal_id in goal_ids[1:]: np.minimum(bounds, network.landmarks.lower_bounds(goal_id), out=bounds)
+            return bounds.tolist()
+
+    start, goal_ids = network.label_to_index(network.start), [network.label_to_index(goal) for goal in goals]
+    paths, iterations = search_goals(len(network.labels), start, goal_ids, edges, heuristic, n_goals, max_iterations)
+    return {network.labels[goal]: [network.labels[node_id] for node_id in path] for goal, path in paths.items()}, iterations
+
+
+def network_distance_field(network, source):
+    # Dijkstra sweep from the source node ID over the whole network. Returns (distances, predecessors) indexed by node
+    # ID, with -1 predecessors for the source and unreachable nodes.
+
+    indptr, indices, costs = network.indptr, network.indices, network.costs
+
+    distances = np.full(len(network.labels), np.inf)
+    predecessors = np.full(len(network.labels), -1, dtype=np.int64)
+    closed = np.zeros(len(network.labels), dtype=bool)
+
+    distances[source] = 0
+    open_heap = [(0, source)]
+    while open_heap:
+        current_distance, current = heapq.heappop(open_heap)
+        if closed[current]: continue
+        closed[current] = True
+
+        first, last = indptr[current], indptr[current+1]
+        for neighbour, cost in zip(indices[first:last].tolist(), costs[first:last].tolist()):
+            if closed[neighbour]: continue
+            neighbour_distance = current_distance + cost
+            if neighbour_distance >= distances[neighbour]: continue
+            distances[neighbour], predecessors[neighbour] = neighbour_distance, current
+            heapq.heappush(open_heap, (neighbour_distance, neighbour))
+
+    return distances, predecessors
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+
+# LRU cache of optimal paths for repeated queries on a mostly static graph. Entries are keyed by
+# (start, end, heuristic_type, diagonality) and stamped with the graph version they were solved against: the whole
+# cache is dropped as soon as the graph's version moves on. Any cached path through both new endpoints (in order)
+# answers the query with a slice, since every subpath of an optimal path is itself optimal. The memory bound counts
+# stored labels across all paths.
+
+class PathCache:
+
+    def __init__(self, max_entries=1024, max_labels=10**6):
+        if max_entries < 1 or max_labels < 1: raise Exception('PathCache bounds must be positive.')
+        self.max_entries, self.max_labels = max_entries, max_labels
+        self.version = None
+        self.hits, self.subpath_hits, self.misses = 0, 0, 0
+        self.clear()
+
+    def __len__(self): return len(self._paths)
+
+    def __contains__(self, key): return key in self._paths
+
+    def clear(self):
+        self._paths = OrderedDict()     # key -> (path, {label: position in path})
+        self._containing = {}           # label -> set of keys whose paths pass through it
+        self.n_labels = 0
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self._paths: _logger.info('Graph version changed, dropping {} cached paths.'.format(len(self._paths)))
+            self.clear()
+            self.version = version
+
+    def get(self, key, version):
+        # Returns a cached path (a new list) for key, or None
+        self._check_version(version)
+        if key in self._paths:
+            self._paths.move_to_end(key)
+            self.hits += 1
+            return list(self._paths[key][0])
+
+        start, end, settings = key[0], key[1], key[2:]
+        candidates = self._containing.get(start, set()) & self._containing.get(end, set())
+        for candidate in candidates:
+            if candidate[2:] != settings: continue
+            path, positions = self._paths[candidate]
+            if positions[start] < positions[end]:
+                self._paths.move_to_end(candidate)
+                self.subpath_hits += 1
+                return path[positions[start]:positions[end]+1]
+
+        self.misses += 1
+        return None
+
+    def put(self, key, path, version):
+        self._check_version(version)
+        if len(path) > self.max_labels: return
+        if key in self._paths: self._remove(key)
+        # Paths revisiting a label aren't optimal and can't be sliced unambiguously
+        positions = {label: i for i, label in enumerate(path)}
+        if len(positions) != len(path): return
+
+        self._paths[key] = (list(path), positions)
+        for label in positions: self._containing.setdefault(label, set()).add(key)
+        self.n_labels += len(path)
+        while len(self._paths) > self.max_entries or self.n_labels > self.max_labels:
+            self._remove(next(iter(self._paths)))
+
+    def _remove(self, key):
+        path, positions = self._paths.pop(key)
+        for label in positions:
+            keys = self._containing[label]
+            keys.discard(key)
+            if not keys: del self._containing[label]
+        self.n_labels -= len(path)
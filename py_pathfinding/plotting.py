@@ -1,50 +1,87 @@
-import pickle
+import numpy as np
 from pathlib import Path
 
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.patches as ptc
+from matplotlib import animation, colors
 
-from nicpy import nic_misc, nic_pic
-import a_star
-from geometry import Square, SquareGrid
+from history import SearchHistory, EXPANDED, PUSHED
 
 
-def algo_animation(history_directory, fps=2, frame_skip=1):
+# Cell colours for the image-based renderer, matching the patch colours used by plot_maze
+FREE_RGB, WALL_RGB = colors.to_rgb([1, 1, 1]), colors.to_rgb([0.3, 0.2, 0.1])
+START_RGB, END_RGB, PATH_RGB = colors.to_rgb('r'), colors.to_rgb('g'), colors.to_rgb('b')
+CLOSED_RGB, OPEN_RGB = colors.to_rgb('y'), colors.to_rgb('m')
 
+
+def algo_animation(history_directory, fps=2, frame_skip=1, dpi=100):
+
+    # Paint the search state into an RGB image (one pixel per cell), update it incrementally from the event log
+    # between frames and stream each frame straight to the video writer
     matplotlib.use('Agg')   # Gets rid of plot popups, faster to produce frames
-    max_iteration = 0       # Find the number of iterations saved
-    for file in history_directory.iterdir():
-        if file.is_file():
-            string_iter_num = str(file.stem).split('_')[0]
-            if string_iter_num != 'graph':
-                if int(string_iter_num)>max_iteration: max_iteration = int(string_iter_num)
-
-    # Save a frame for each algo iteration
-    counter = 0
-    frames_directory = history_directory/'frames'
-    nic_misc.mkdir_if_DNE(frames_directory)
+    history = SearchHistory(history_directory)
+    maze, max_iteration = history.graph, history.iterations
+
     its = list(range(0, max_iteration+1, frame_skip))
     if its[-1] != max_iteration: its.append(max_iteration)
-    for iteration in its:
-        print('Producing image {} of {}'.format(iteration+1, max_iteration+1))
-        frame = plot_algo_state(history_directory, iteration)
-        frame.savefig(frames_directory/'frame_{}.png'.format(str(counter).zfill(5)), bbox_inches='tight')
-        counter += 1
-        plt.close(frame)
-
-    nic_pic.frames_to_video(frames_directory, video_name_with_format='video.avi', image_format='png', fps=fps)
-
-def plot_algo_state(history_directory, iteration):
-    maze = pickle.load(open(str(history_directory/'graph.dat'.format(iteration)), 'rb'))
-    closed_list = pickle.load(open(str(history_directory/'{}_closed_list.dat'.format(iteration)), 'rb'))
-    open_list = pickle.load(open(str(history_directory/'{}_open_list.dat'.format(iteration)), 'rb'))
-    current_node = pickle.load(open(str(history_directory/'{}_current_node.dat'.format(iteration)), 'rb'))
-    current_path = a_star.reconstruct_path(current_node)
-    fig = plot_maze(maze, current_path, closed_list, open_list)
+
+    state_image = maze_image(maze)
+    parents = np.full(maze.maze_array.size, -1, dtype=np.int64)
+    current = maze.label_to_index(maze.start)
+
+    fig, ax = plt.subplots(1, dpi=dpi)
+    ax.axis('off')
+    image = ax.imshow(state_image, interpolation='nearest')
+    writer = animation.FFMpegWriter(fps=fps)
+    with writer.saving(fig, str(history_directory/'video.avi'), dpi):
+        previous_offset = 0
+        for counter, iteration in enumerate(its):
+            print('Producing image {} of {}'.format(counter+1, len(its)))
+            offset = history.offset(iteration)
+            current = paint_events(state_image, parents, history.events[previous_offset:offset], current)
+            previous_offset = offset
+            image.set_data(paint_path(maze, state_image.copy(), parents, current))
+            writer.grab_frame()
+    plt.close(fig)
+
+
+def maze_image(maze):
+    image = np.empty(maze.dimensions + (3,))
+    image[maze.maze_array != 0] = FREE_RGB
+    image[maze.maze_array == 0] = WALL_RGB
+    return image
+
+
+def paint_events(state_image, parents, events, current):
+    # Apply a slice of history events to the state image and parents array, returning the latest expanded node
+    pixels = state_image.reshape(-1, 3)
+    pushes = events[events['kind'] == PUSHED]
+    expanded = events['node'][events['kind'] == EXPANDED]
+    pixels[pushes['node']] = OPEN_RGB
+    parents[pushes['node']] = pushes['parent']
+    pixels[expanded] = CLOSED_RGB
+    return int(expanded[-1]) if expanded.size else current
+
+
+def paint_path(maze, frame, parents, current):
+    pixels = frame.reshape(-1, 3)
+    node = parents[current]
+    while node != -1 and parents[node] != -1:
+        pixels[node] = PATH_RGB
+        node = parents[node]
+    pixels[maze.label_to_index(maze.start)] = START_RGB
+    pixels[maze.label_to_index(maze.end)] = END_RGB
+    return frame
+
+def plot_algo_state(history, iteration):
+    # history is a SearchHistory, or the directory of a saved one
+    if not isinstance(history, SearchHistory): history = SearchHistory(history)
+    current_label, current_path, closed_labels, open_labels = history.state(iteration)
+    fig = plot_maze(history.graph, current_path, closed_labels, open_labels)
     return fig
 
-def plot_maze(maze, current_path=None, closed_list=None, open_list=None):
+def plot_maze(maze, current_path=None, closed_labels=None, open_labels=None):
     maze.check_graph()
     fig, ax = plt.subplots(1, dpi=100)
     plt.gca().invert_yaxis()
@@ -67,13 +104,12 @@ def plot_maze(maze, current_path=None, closed_list=None, open_list=None):
             elif (row, col) == maze.end: ax.add_patch(ptc.Rectangle([col, row], patch_width, patch_width, color='g'))
 
     # These elements change each time
-    if closed_list:
-        for node in closed_list:
-            ax.add_patch(ptc.Rectangle((node.label[1], node.label[0]), patch_width, patch_width, color='y'))
-    if open_list:
-        for pair in open_list.elements:
-            node = pair[1]
-            ax.add_patch(ptc.Rectangle((node.label[1], node.label[0]), patch_width, patch_width, color='m'))
+    if closed_labels:
+        for label in closed_labels:
+            ax.add_patch(ptc.Rectangle((label[1], label[0]), patch_width, patch_width, color='y'))
+    if open_labels:
+        for label in open_labels:
+            ax.add_patch(ptc.Rectangle((label[1], label[0]), patch_width, patch_width, color='m'))
     if current_path:
         for i, step in enumerate(current_path[1:-1]):
             # ax.add_patch(ptc.Rectangle((step[1], step[0]), 1, 1, color='b'))
@@ -0,0 +1,130 @@
+import time
+
+import logging
+_logger = logging.getLogger('pathfinding_logger')
+
+
+# Structured search results and observer hooks. A SearchResult says unambiguously whether a path was found, and
+# carries the search's counters and phase timings; it still unpacks as (path, iterations) like the tuples returned by
+# the array engines. Observers receive node events from run_a_star; with no observer the search only pays for a
+# few `if observer` checks, so instrumentation can stay wired in.
+
+FOUND, UNREACHABLE, MAX_ITERATIONS, TIME_LIMIT, CACHED = 'found', 'unreachable', 'max_iterations', 'time_limit', 'cached'
+
+
+class SearchResult:
+
+    def __init__(self, path, iterations, status, method=None, pushed=None, stale_pops=None, peak_open=None,
+                 timings=None, call_seconds=None, call_counts=None, bound=None, weight=None):
+        self.path = path                    # label path (the partial path so far if stopped at max_iterations)
+        self.iterations = iterations        # nodes expanded
+        self.status = status
+        self.method = method
+        self.pushed, self.stale_pops, self.peak_open = pushed, stale_pops, peak_open
+        self.timings = {} if timings is None else timings                   # phase: wall seconds
+        self.call_seconds = {} if call_seconds is None else call_seconds    # graph method: seconds (when timed)
+        self.call_counts = {} if call_counts is None else call_counts
+        # Suboptimality bound: the path costs at most bound times the optimum (1.0 for an optimal path, None when no
+        # bound is known or no path was found). weight is the heuristic weight the search used, if any.
+        self.bound, self.weight = bound, weight
+
+    @classmethod
+    def from_search(cls, path, iterations, end, max_iterations=10**6, method=None, seconds=None):
+        # From the (path or None, iterations) returned by the array engines, which signal running out of budget by
+        # returning max_iterations + 1 iterations (only max_iterations nodes were expanded)
+        if iterations is not None and iterations > max_iterations: status, iterations = MAX_ITERATIONS, max_iterations
+        elif path is None or path[-1] != end: status = UNREACHABLE
+        else: status = FOUND
+        return cls(path, iterations, status, method, timings=None if seconds is None else {'total': seconds})
+
+    @property
+    def found(self): return self.status in (FOUND, CACHED)
+
+    @property
+    def expanded(self): return self.iterations
+
+    @property
+    def solution(self):
+        # The legacy graph.solution value: the path (even a partial one), otherwise the iterations
+        return self.iterations if self.path is None else self.path
+
+    def __iter__(self): return iter((self.path, self.iterations))
+
+    def __repr__(self):
+        return 'SearchResult({}, {} steps, {} expanded, {} pushed, bound {})'.format(
+            self.status, None if self.path is None else len(self.path)-1, self.iterations, self.pushed, self.bound)
+
+
+class SearchObserver:
+
+    # Base class for run_a_star observers; override any of the hooks. With time_calls set, the search also times its
+    # graph.find_neighbours and graph.create_node calls into SearchResult.call_seconds.
+    time_calls = False
+
+    def started(self, graph): pass
+
+    def expanded(self, iteration, node): pass
+
+    def pushed(self, iteration, node): pass
+
+    def finished(self, result): pass
+
+
+class ObserverGroup(SearchObserver):
+
+    def __init__(self, observers):
+        self.observers = [observer for observer in observers if observer is not None]
+        self.time_calls = any(observer.time_calls for observer in self.observers)
+
+    def started(self, graph):
+        for observer in self.observers: observer.started(graph)
+
+    def expanded(self, iteration, node):
+        for observer in self.observers: observer.expanded(iteration, node)
+
+    def pushed(self, iteration, node):
+        for observer in self.observers: observer.pushed(iteration, node)
+
+    def finished(self, result):
+        for observer in self.observers: observer.finished(result)
+
+
+class SearchProfiler(SearchObserver):
+
+    # Accumulates counters and timings over every search it observes
+    time_calls = True
+
+    def __init__(self):
+        self.searches, self.statuses = 0, {}
+        self.totals = {'expanded': 0, 'pushed': 0, 'stale_pops': 0}
+        self.peak_open = 0
+        self.timings, self.call_seconds, self.call_counts = {}, {}, {}
+
+    def finished(self, result):
+        self.searches += 1
+        self.statuses[result.status] = self.statuses.get(result.status, 0) + 1
+        for name, value in (('expanded', result.iterations), ('pushed', result.pushed), ('stale_pops', result.stale_pops)):
+            self.totals[name] += value or 0
+        self.peak_open = max(self.peak_open, result.peak_open or 0)
+        for totals, values in ((self.timings, result.timings), (self.call_seconds, result.call_seconds), (self.call_counts, result.call_counts)):
+            for name, value in values.items(): totals[name] = totals.get(name, 0) + value
+
+    def report(self):
+        lines = ['{} searches ({}), peak open set {}'.format(
+            self.searches, ', '.join('{} {}'.format(count, status) for status, count in self.statuses.items()), self.peak_open)]
+        lines += ['{}: {}'.format(name, value) for name, value in self.totals.items()]
+        lines += ['{} phase: {:.6f}s'.format(name, value) for name, value in self.timings.items()]
+        lines += ['{}: {} calls, {:.6f}s'.format(name, self.call_counts[name], value) for name, value in self.call_seconds.items()]
+        return '\n'.join(lines)
+
+
+def timed_call(function, name, call_seconds, call_counts):
+    # Wraps a graph method so each call's wall time is added to call_seconds[name]
+    call_seconds[name], call_counts[name] = 0.0, 0
+    def timed(*args):
+        start_time = time.perf_counter()
+        try: return function(*args)
+        finally:
+            call_seconds[name] += time.perf_counter() - start_time
+            call_counts[name] += 1
+    return timed
@@ -0,0 +1,35 @@
+import logging
+import numpy as np
+
+from geometry import SquareGrid
+
+
+# D* Lite repairs after update_cells must find paths as cheap as a fresh search. Integer cell costs with diagonal
+# moves give many equal-cost paths whose keys differ only by float rounding, which once ended repairs too early.
+
+def test_repaired_d_star_lite_paths_match_grid_a_star():
+    logging.disable(logging.CRITICAL)
+    try:
+        rng = np.random.default_rng(2)
+        repairs = 0
+        for _ in range(60):
+            size = int(rng.integers(5, 15))
+            maze = rng.integers(1, 6, (size, size)).astype(float)*(rng.random((size, size)) > 0.2)
+            start, end = (0, 0), (size-1, size-1)
+            maze[start] = maze[end] = 1
+            grid = SquareGrid('euclidian', diagonality=True, maze_array=maze)
+            grid.set_start(start)
+            grid.set_end(end)
+            for _ in range(25):
+                cells = {tuple(int(v) for v in rng.integers(0, size, 2)) for _ in range(3)} - {start, end}
+                grid.update_cells({cell: 0 if rng.random() < 0.3 else float(rng.integers(1, 6)) for cell in cells})
+                grid.solve(method='d_star_lite')
+                repaired, planner = grid.result, grid.planner
+                grid.solve(method='grid_a_star')
+                fresh = grid.result
+                grid.planner = planner
+                assert repaired.found == fresh.found
+                if fresh.found: assert np.isclose(grid.path_cost(repaired.path), grid.path_cost(fresh.path))
+                repairs += 1
+        assert repairs == 1500
+    finally: logging.disable(logging.NOTSET)